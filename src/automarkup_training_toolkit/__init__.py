@@ -1,3 +1,16 @@
 # SPDX-FileCopyrightText: 2023-present U.N. Owen <paul@prescod.net>
 #
 # SPDX-License-Identifier: MIT
+from typing import Any
+
+__all__ = ["Example", "iter_examples"]
+
+
+def __getattr__(name: str) -> Any:
+    # Imported on first use: loading the pipeline with the package would also load every module
+    # run with -m (simplify_html, parsers, ...) before runpy executes it as __main__.
+    if name in __all__:
+        from automarkup_training_toolkit import pipeline
+
+        return getattr(pipeline, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
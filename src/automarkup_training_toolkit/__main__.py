@@ -1,9 +1,24 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+from io import StringIO
 from itertools import chain
+import os
 from pathlib import Path
-import re
-from typing import  Optional
-from .converters import HtmlToMessYEConverter, SimplifiedDitaConverter, DitaMarkdownConverter, DitaHtmlConverter, HtmlToSimplifiedHtmlConverter, HtmlToMessyConverter, PandocRstConverter, PandocTxtConverter, PandocAsciidocConverter, PandocOrgModeConverter
+import sys
+import traceback
+from typing import Dict, List, Optional, Set, Tuple
+from .cache import ArtifactCache
+from .dataset import copy_files_metrics_ready, require_zstandard, write_dataset
+from .doctype import DoctypeIndex
+from .profiling import Profiler
+from .pipeline import build_converters, build_stages, matches_doctype
+from .scheduler import run_stages
+from .sharding import parse_shard, select_shard, write_shard_manifest
+from . import metrics, parsers, pipeline, tools
+from .simplify_html import VERIFY_MODES
+from .converters import Converter, DitaConverter, DitaHtmlConverter, HtmlToSimplifiedHtmlConverter
 
 
 def parse_args():
@@ -12,67 +27,224 @@ def parse_args():
     parser.add_argument('--output_dir', type=Path, default='out', help='Output directory for processed files')
     parser.add_argument('--doctype', type=str, help='The doctype to process')
     parser.add_argument('--glob', type=str, default='*.xml,*.dita', help='The file type to process')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of topics to process in parallel')
+    parser.add_argument('--dita_batch', type=int, default=1, help='Number of topics to convert per DITA-OT run')
+    parser.add_argument('--stage_workers', type=int, default=4, help='Number of conversion stages of a topic to run at once; 1 with --profile')
+    parser.add_argument('--dita_procs', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='Maximum number of DITA-OT runs at once, across all jobs')
+    parser.add_argument('--pandoc_procs', type=int, default=os.cpu_count() or 1, help='Maximum number of pandoc runs at once, across all jobs')
+    parser.add_argument('--dita_timeout', type=float, default=900, help='Seconds after which a DITA-OT run is killed; 0 for no limit')
+    parser.add_argument('--pandoc_timeout', type=float, default=300, help='Seconds after which a pandoc run is killed; 0 for no limit')
+    parser.add_argument('--messy_variants', type=int, default=5, help='Number of messy Markdown variants per topic')
+    parser.add_argument('--html_parser', choices=parsers.HTML_PARSERS, default='html.parser', help='BeautifulSoup parser for HTML documents')
+    parser.add_argument('--verify_simplify', choices=VERIFY_MODES, default='full', help='Check that simplifying the HTML does not change its Markdown rendering; mismatches are dumped to OUTPUT_DIR/diagnostics')
+    parser.add_argument('--verify_sample_rate', type=float, default=0.1, help='Fraction of topics checked with --verify_simplify sampled')
+    parser.add_argument('--native_html', action='store_true', help='Experimental: render DITA topics to HTML in-process where possible, falling back to DITA-OT; check a corpus first with python -m automarkup_training_toolkit.dita_html --compare')
+    parser.add_argument('--cache_dir', type=Path, help='Directory for the content-addressed cache of converter outputs')
+    parser.add_argument('--cache_max_mb', type=int, default=10240, help='Maximum size of the cache in megabytes')
+    parser.add_argument('--output_format', choices=('files', 'dataset'), default='files', help='Write a metrics_ready directory tree or a packed, sharded dataset')
+    parser.add_argument('--shard_mb', type=int, default=256, help='Maximum size of a dataset shard in megabytes')
+    parser.add_argument('--compress', action='store_true', help='Compress dataset records with zstd')
+    parser.add_argument('--shard', type=parse_shard, help='Process only shard INDEX/COUNT of the topics, e.g. 0/4, and record it for merging')
+    parser.add_argument('--metrics', type=Path, help='Write per-stage timings and sizes to this JSON-lines file')
+    parser.add_argument('--trace', type=Path, help='Write the stages as Chrome trace events to this JSON file')
+    parser.add_argument('--profile', type=Path, help='Profile the in-process stages and write per-converter reports to this directory; runs one stage of a topic at a time')
     return parser.parse_args()
 
 
-def process_file(input_file: Path, input_dir: Path, output_dir: Path, transformations: dict, doctype: Optional[str]=None):
-    with input_file.open() as f:
-        if doctype and not re.search(f'<!DOCTYPE\\s+{doctype}', f.read()):
-            return
-        
-    output_dir = output_dir / input_file.relative_to(input_dir).stem
+STAGE_WORKERS = 1
 
-    base_name = input_file.stem
+
+def stage_workers(args: Namespace) -> int:
+    """Stages of a topic to run at once. The profiler measures one step at a time, so with --profile
+    overlapping stages would only queue on it and skew their timings; they run in turn instead."""
+    return 1 if args.profile else args.stage_workers
+
+
+def configure(args: Namespace, tool_semaphores: Optional[dict]=None):
+    """Apply pipeline-wide settings; also runs as the initializer of pool workers.
+
+    Workers get the main process's tool semaphores, so the tool caps hold across all of them."""
+    global STAGE_WORKERS
+    STAGE_WORKERS = stage_workers(args)
+    pipeline.MESSY_VARIANTS = args.messy_variants
+    parsers.set_html_parser(args.html_parser)
+    HtmlToSimplifiedHtmlConverter.verify = args.verify_simplify
+    HtmlToSimplifiedHtmlConverter.verify_sample_rate = args.verify_sample_rate
+    HtmlToSimplifiedHtmlConverter.diagnostics_dir = Path(args.output_dir) / "diagnostics"
+    DitaHtmlConverter.native = args.native_html
+    metrics.recorder = metrics.StageRecorder()
+    tools.runner = tools.ToolRunner({'dita': args.dita_procs, 'pandoc': args.pandoc_procs},
+                                    {'dita': args.dita_timeout, 'pandoc': args.pandoc_timeout}, tool_semaphores)
+    tools.stop_on_signals()
+    if args.profile:
+        Converter.profiler = Profiler()
+    if args.cache_dir:
+        Converter.cache = ArtifactCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+
+
+def take_stats() -> Dict[str, Dict[str, float]]:
+    """Collect and reset this process's counters, so pool workers can report them per task."""
+    stats = {}
+    if Converter.cache is not None:
+        stats['cache'] = Converter.cache.take_stats()
+    if DitaHtmlConverter.native:
+        stats.update(DitaHtmlConverter.take_stats())
+    stats.update(tools.runner.take_stats())
+    return stats
+
+
+def add_stats(total: Dict[str, Dict[str, int]], stats: Dict[str, Dict[str, int]]):
+    for group, counts in stats.items():
+        for name, count in counts.items():
+            total.setdefault(group, {})[name] = total.get(group, {}).get(name, 0) + count
+
+
+def print_stats(stats: Dict[str, Dict[str, int]]):
+    if 'cache' in stats:
+        cache = stats['cache']
+        print(f"Cache: {cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions")
+    tools.print_stats(stats, tools.runner.limits)
+    if 'html_renderer' in stats:
+        renderers = stats['html_renderer']
+        print(f"HTML: {renderers.get('native', 0)} topics rendered natively, {renderers.get('dita-ot', 0)} with DITA-OT")
+        for reason, count in sorted(stats.get('html_fallback', {}).items(), key=lambda item: -item[1]):
+            print(f"  {count:6d}  {reason}")
+
+
+def process_file(input_file: Path, input_dir: Path, output_dir: Path, doctype: Optional[str]=None):
+    if not matches_doctype(input_file, doctype):
+        return
     print(input_file)
-    transformations = {'Original': input_file}
-
-    plain_text = output_dir / "plain_text"
-    markup = output_dir / "markup"
-    tmp = output_dir / "tmp"
-
-    converters = [
-        SimplifiedDitaConverter(markup, base_name, transformations, 'Original'),
-        DitaMarkdownConverter(plain_text, base_name, transformations, SimplifiedDitaConverter.__name__),
-        DitaHtmlConverter(tmp, base_name, transformations, SimplifiedDitaConverter.__name__),
-        HtmlToSimplifiedHtmlConverter(markup, base_name, transformations, 'DitaHtmlConverter'),
-        HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', 1),
-        HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', 2),
-        HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', 3),
-        HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', 4),
-        HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', 5),
-        PandocRstConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
-        PandocTxtConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
-        PandocAsciidocConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
-        PandocOrgModeConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
-        HtmlToMessYEConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
-    ]
-
-    for converter in converters:
-        converter.convert()
-
-def copy_files_metrics_ready(formats_dir: Path, metrics_ready_dir: Path):
-    prompt = Path("prompt.txt")
-    
-    for filename in formats_dir.glob("*/plain_text/*"):
-        new_filename = Path(str(metrics_ready_dir / filename.name.split(".")[0] / filename.name ) + ".txt")
-        new_filename.parent.mkdir(parents=True, exist_ok=True)
-        new_filename.write_text(filename.read_text())
-        (new_filename.parent / prompt.name).write_text(prompt.read_text())
-        dita = list((filename.parent.parent / "markup").glob("*.dita"))[0]
-        new_filename.with_suffix(".xml").write_text(dita.read_text())
-        html = list((filename.parent.parent / "markup").glob("*.html"))[0]
-        new_filename.with_suffix(".html").write_text(html.read_text())
+    converters = build_converters(input_file, input_dir, output_dir)
+    try:
+        run_stages(build_stages(converters), STAGE_WORKERS)
+    finally:
+        converters[0].manifest.save()
+
+
+def prepare_dita_batch(input_files: List[Path], input_dir: Path, output_dir: Path, doctype: Optional[str]=None):
+    """Run the leading DITA-OT stages of several topics with one dita invocation per stage.
+
+    process_file then finds these outputs in place and skips the stages. A topic whose output is
+    missing after a batch is dropped from later batches and converted on its own by process_file."""
+    topics = [build_converters(f, input_dir, output_dir) for f in input_files if matches_doctype(f, doctype)]
+    stage = 0
+    while topics and all(isinstance(converters[stage], DitaConverter) for converters in topics):
+        batch = [converters[stage] for converters in topics]
+        metrics.measure(None, f"{batch[0].__class__.__name__} batch", batch, partial(DitaConverter.convert_batch, batch))
+        for converters in topics:
+            converters[stage].manifest.save()
+        topics = [converters for converters in topics
+                  if converters[stage].output_file.exists() and converters[stage].is_current()]
+        stage += 1
+
+
+def process_file_isolated(input_file: Path, input_dir: Path, output_dir: Path, doctype: Optional[str]=None) -> Tuple[Path, str, Optional[str]]:
+    """Run process_file in a pool worker, returning its captured output and any error instead of raising."""
+    log = StringIO()
+    error = None
+    with redirect_stdout(log):
+        try:
+            process_file(input_file, input_dir, output_dir, doctype)
+        except Exception:
+            error = traceback.format_exc()
+    return input_file, log.getvalue(), error
+
+
+def process_batch_isolated(input_files: List[Path], input_dir: Path, output_dir: Path, doctype: Optional[str]=None) -> Tuple[str, List[Tuple[Path, str, Optional[str]]], Dict[str, Dict[str, int]], List[dict], Optional[dict]]:
+    """Run a batch of topics in a pool worker: the shared DITA-OT stages first, then each topic on its own."""
+    log = StringIO()
+    if len(input_files) > 1:
+        with redirect_stdout(log):
+            try:
+                prepare_dita_batch(input_files, input_dir, output_dir, doctype)
+            except Exception:
+                print(f"DITA-OT batch failed, converting topics one at a time:\n{traceback.format_exc()}")
+    results = [process_file_isolated(f, input_dir, output_dir, doctype) for f in input_files]
+    profile = Converter.profiler.take() if Converter.profiler is not None else None
+    return log.getvalue(), results, take_stats(), metrics.take_records(), profile
+
+
+def batched(input_files: List[Path], size: int) -> List[List[Path]]:
+    size = max(size, 1)
+    return [input_files[i:i + size] for i in range(0, len(input_files), size)]
+
+
+def process_files_parallel(input_files: list, output_dir: Path, args: Namespace, stats: Dict[str, Dict[str, int]], records: List[dict]) -> Set[Path]:
+    """Process topics on a pool of `args.jobs` processes and return the files that failed.
+
+    Each topic's output is printed as one block, in input order."""
+    failed = set()
+    task = partial(process_batch_isolated, input_dir=args.input_dir, output_dir=output_dir)
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=configure, initargs=(args, tools.runner.semaphores)) as executor:
+        for batch_log, results, batch_stats, batch_records, batch_profile in executor.map(task, batched(input_files, args.dita_batch)):
+            add_stats(stats, batch_stats)
+            records.extend(batch_records)
+            if batch_profile is not None:
+                Converter.profiler.add(batch_profile)
+            print(batch_log, end="")
+            for input_file, log, error in results:
+                print(log, end="")
+                if error:
+                    print(f"FAILED: {input_file}\n{error}", end="")
+                    failed.add(input_file)
+            sys.stdout.flush()
+    return failed
+
 
 def main():
     args = parse_args()
-    transformations = {}
+    if args.output_format == 'dataset' and args.compress:
+        require_zstandard()
+    configure(args)
+    if args.profile and args.stage_workers > 1:
+        print("Profiling runs one stage of a topic at a time; --stage_workers is ignored")
     formats_dir = Path(args.output_dir) / "formats"
-    files = (args.input_dir.rglob(pat) for pat in args.glob.split(","))
-    for input_file in chain(*files):
-        process_file(input_file, args.input_dir, formats_dir, transformations, args.doctype)
-    metrics_ready_dir = Path(args.output_dir) / "metrics_ready"
-    metrics_ready_dir.mkdir(parents=True, exist_ok=True)
-    copy_files_metrics_ready(formats_dir, metrics_ready_dir)
+    files = list(chain(*(args.input_dir.rglob(pat) for pat in args.glob.split(","))))
+    if args.shard:
+        files = select_shard(files, args.input_dir, args.shard)
+    if args.doctype:
+        index = DoctypeIndex(Path(args.output_dir) / "doctype_index.json")
+        files = [input_file for input_file in files if index.matches(input_file, args.doctype)]
+        index.save()
+    failed = set()
+    stats = {}
+    records = []
+    if args.jobs > 1:
+        failed = process_files_parallel(files, formats_dir, args, stats, records)
+    else:
+        for batch in batched(files, args.dita_batch):
+            if len(batch) > 1:
+                prepare_dita_batch(batch, args.input_dir, formats_dir)
+            for input_file in batch:
+                process_file(input_file, args.input_dir, formats_dir)
+        add_stats(stats, take_stats())
+        records.extend(metrics.take_records())
+    if args.metrics:
+        metrics.write_jsonl(args.metrics, records)
+    if args.trace:
+        metrics.write_trace(args.trace, records)
+    if args.profile:
+        Converter.profiler.write_report(args.profile)
+        print(f"Wrote profile to {args.profile}")
+    if args.shard:
+        write_shard_manifest(Path(args.output_dir), args.shard, files, args.input_dir, failed)
+    skip = {f.relative_to(args.input_dir).stem for f in failed}
+    if args.output_format == 'dataset':
+        dataset_dir = Path(args.output_dir) / "dataset"
+        count = write_dataset(formats_dir, dataset_dir, skip, args.shard_mb * 1024 * 1024, args.compress)
+        print(f"Wrote {count} records to {dataset_dir}")
+    else:
+        metrics_ready_dir = Path(args.output_dir) / "metrics_ready"
+        metrics_ready_dir.mkdir(parents=True, exist_ok=True)
+        copy_files_metrics_ready(formats_dir, metrics_ready_dir, skip)
+    print_stats(stats)
+    metrics.print_summary(records)
+    if failed:
+        print(f"{len(failed)} file(s) failed:")
+        for input_file in sorted(failed):
+            print(f"  {input_file}")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
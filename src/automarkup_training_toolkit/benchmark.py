@@ -0,0 +1,308 @@
+"""Benchmarks for the in-process conversion stages.
+
+`run` times simplify_html, html_to_messy and HTMLToMarkdownConverter on a seeded, synthetic
+corpus of DITA-OT-style HTML and writes the timings as JSON; `compare` checks a later run
+against such a baseline:
+
+    python -m automarkup_training_toolkit.benchmark run --output baseline.json
+    python -m automarkup_training_toolkit.benchmark run --output current.json
+    python -m automarkup_training_toolkit.benchmark compare baseline.json current.json --threshold 0.1
+
+    python -m automarkup_training_toolkit.benchmark links --links 2000
+"""
+import argparse
+import json
+from pathlib import Path
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from automarkup_training_toolkit import parsers
+from automarkup_training_toolkit.html2markdown import _CLOSE, _LINK_OPEN, HTMLToMarkdownConverter, unicode
+from automarkup_training_toolkit.html_to_messy import render_messy
+from automarkup_training_toolkit.simplify_html import simplify_html
+
+BASELINE_VERSION = 1
+WORDS = ("option", "value", "the", "parameter", "build", "output", "plug-in", "topic", "map", "file", "set",
+         "transform", "to", "a", "with", "key", "attribute", "element", "and", "of")
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def inline(rng: random.Random) -> str:
+    """A run of text with the inline markup DITA-OT emits."""
+    shape = rng.randrange(6)
+    if shape == 0:
+        return f'{words(rng, 6)} <span class="keyword">{rng.choice(WORDS)}</span> {words(rng, 4)}'
+    if shape == 1:
+        return f'{words(rng, 3)} <code class="ph codeph">args.{rng.choice(WORDS)}_name</code> {words(rng, 5)}'
+    if shape == 2:
+        return f'{words(rng, 5)} <strong class="ph b">{words(rng, 2)}</strong> {words(rng, 3)}'
+    if shape == 3:
+        return f'{words(rng, 4)} <a class="xref" href="topics/{rng.choice(WORDS)}.html">{words(rng, 3)}</a>'
+    if shape == 4:
+        return f'{words(rng, 4)} <em class="ph i">{words(rng, 2)}</em> * {words(rng, 3)}'
+    return words(rng, 10)
+
+
+def ordered_list_body(rng: random.Random, scale: int) -> str:
+    steps = []
+    for i in range(60 * scale):
+        info = f'<div class="itemgroup info"><p class="p">{inline(rng)}</p></div>' if rng.random() < 0.3 else ''
+        steps.append(f'<li class="li step"><span class="ph cmd">Step {i}: {inline(rng)}</span>{info}</li>')
+    return f'<ol class="ol steps">{"".join(steps)}</ol>'
+
+
+def nested_body(rng: random.Random, scale: int) -> str:
+    html = f'<p class="p">{inline(rng)}</p>'
+    for depth in range(20 + 5 * scale):
+        tag = "ol" if depth % 2 else "ul"
+        html = (f'<{tag} class="{tag}"><li class="li">{inline(rng)}</li><li class="li">{inline(rng)}{html}</li>'
+                f'<li class="li">{inline(rng)}</li></{tag}>')
+    return f'<div class="section">{html}</div>'
+
+
+def table_body(rng: random.Random, scale: int) -> str:
+    columns = 6
+    head = "".join(f'<th class="entry" id="t__entry__{c}">{words(rng, 2)}</th>' for c in range(columns))
+    rows = "".join('<tr class="row">' + "".join(f'<td class="entry" headers="t__entry__{c}">{inline(rng)}</td>'
+                                              for c in range(columns)) + '</tr>'
+                   for _ in range(80 * scale))
+    return (f'<table class="table" border="1" frame="hsides"><caption><span class="table--title-label">Table 1. '
+            f'</span>{words(rng, 4)}</caption><colgroup>{"<col/>" * columns}</colgroup>'
+            f'<thead class="thead"><tr class="row">{head}</tr></thead><tbody class="tbody">{rows}</tbody></table>')
+
+
+def links_body(rng: random.Random, scale: int) -> str:
+    paragraphs = []
+    for i in range(60 * scale):
+        links = []
+        for j in range(5):
+            href = f"topics/ref_{i}_{j}.html"
+            if rng.random() < 0.2:
+                links.append(f'<a class="xref" href="{href}" title="{words(rng, 4)}">{words(rng, 2)}</a>')
+            elif rng.random() < 0.2:
+                links.append(f'<a class="xref" href="https://example.com/{i}/{j}">https://example.com/{i}/{j}</a>')
+            else:
+                links.append(f'<a class="xref" href="{href}">{words(rng, 3)}</a>')
+        paragraphs.append(f'<p class="p">{words(rng, 3)} {", ".join(links)}.</p>')
+    return "".join(paragraphs)
+
+
+def code_body(rng: random.Random, scale: int) -> str:
+    blocks = []
+    for i in range(40 * scale):
+        lines = "\n".join(f'  {rng.choice(WORDS)}_{n} = &lt;{rng.choice(WORDS)}&gt; * {n} &amp;&amp; _x'
+                          for n in range(rng.randrange(3, 15)))
+        blocks.append(f'<p class="p">{inline(rng)}</p><pre class="pre codeblock"><code>def f_{i}():\n{lines}</code></pre>')
+    return "".join(blocks)
+
+
+def mixed_body(rng: random.Random, scale: int) -> str:
+    parts = [ordered_list_body, nested_body, table_body, links_body, code_body]
+    return "".join(f'<section class="section"><h2 class="title sectiontitle">{words(rng, 3)}</h2>'
+                   f'{part(rng, max(scale // 2, 1))}</section>' for part in parts)
+
+
+SHAPES: Dict[str, Callable[[random.Random, int], str]] = {
+    "ordered_list": ordered_list_body,
+    "nested": nested_body,
+    "table": table_body,
+    "links": links_body,
+    "code": code_body,
+    "mixed": mixed_body,
+}
+
+
+def synthetic_topic(shape: str, seed: int = 0, scale: int = 1) -> str:
+    """A DITA-OT html5-style page whose body stresses one thing, as named by shape."""
+    rng = random.Random(f"{shape}-{seed}")
+    title = words(rng, 4).capitalize()
+    return (f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"/><meta name="generator" content="DITA-OT"/>'
+            f'<title>{title}</title><link rel="stylesheet" type="text/css" href="commonltr.css"/></head>'
+            f'<body id="{shape}"><main role="main"><article class="nested0" role="article" aria-labelledby="ariaid-title1">'
+            f'<h1 class="title topictitle1" id="ariaid-title1">{title}</h1><div class="body refbody">'
+            f'<p class="shortdesc">{inline(rng)}</p>{SHAPES[shape](rng, scale)}</div>'
+            f'<nav role="navigation" class="related-links"><div class="familylinks"><div class="parentlink">'
+            f'<strong>Parent topic:</strong> <a class="link" href="../index.html">Index</a></div></div></nav>'
+            f'</article></main></body></html>')
+
+
+def link_dense_html(links: int, seed: int = 0) -> str:
+    """A reference-topic-like page with `links` xrefs in assorted shapes."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(links):
+        href = f"topics/ref_{i}.html"
+        shape = rng.randrange(5)
+        if shape == 0:
+            link = f'<a href="{href}">Reference {i}</a>'
+        elif shape == 1:
+            link = f'<a href="{href}" title="See reference {i}">the <b>{i}th</b> option</a>'
+        elif shape == 2:
+            link = f'<a href="https://example.com/{i}">https://example.com/{i}</a>'
+        elif shape == 3:
+            link = f'<a href="{href}"><span>parameter_{i}</span></a>'
+        else:
+            link = f'<a href="{href}">see <i>also</i> item * {i}</a>'
+        items.append(f"<li>Related: {link} and more text</li>")
+    return f"<html><head><title>Links</title></head><body><h1>Links</h1><ul>{''.join(items)}</ul></body></html>"
+
+
+class LegacyLinkConverter(HTMLToMarkdownConverter):
+    """HTMLToMarkdownConverter with the link handling it had before links stopped re-parsing their HTML."""
+
+    def _process_a(self, tag):
+        for child in tag.find_all(recursive=False):
+            self._messy_markdownify(child)
+        if not tag.has_attr('href'):
+            return
+        if tag.string != tag.get('href') or tag.has_attr('title'):
+            title = ''
+            if tag.has_attr('title'):
+                title = ' "%s"' % tag['title']
+            tag.string = '[%s](%s%s)' % (BeautifulSoup(unicode(tag), 'html.parser').string,
+                                         tag.get('href', ''),
+                                         title)
+        else:
+            tag.string = _LINK_OPEN + tag.string + _CLOSE
+        tag.unwrap()
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_links(links: int, repeat: int) -> None:
+    html = link_dense_html(links)
+    legacy = LegacyLinkConverter().convert_to_messy(html)
+    current = HTMLToMarkdownConverter().convert_to_messy(html)
+    if legacy != current:
+        raise AssertionError("Link handling changed the output of convert_to_messy")
+    legacy_time = best_time(lambda: LegacyLinkConverter().convert_to_messy(html), repeat)
+    current_time = best_time(lambda: HTMLToMarkdownConverter().convert_to_messy(html), repeat)
+    print(f"convert_to_messy on {links} links (best of {repeat}):")
+    print(f"  re-parsing links: {legacy_time:.3f}s")
+    print(f"  current:          {current_time:.3f}s ({legacy_time / current_time:.1f}x faster)")
+
+
+def timed_stages(html: str, tmp_dir: Path) -> Dict[str, Callable[[], object]]:
+    """The timed stages for one document, each run the way the pipeline runs it."""
+    raw = tmp_dir / "page.raw.html"
+    raw.write_text(html)
+    simplified = tmp_dir / "page.html"
+    simplify_html(raw, simplified, verify="off")
+    simplified_html = simplified.read_text()
+    return {
+        "simplify_html": lambda: simplify_html(raw, simplified, verify="off"),
+        "simplify_html_verified": lambda: simplify_html(raw, simplified, verify="full"),
+        "html_to_messy": lambda: render_messy(simplified_html, range(1, 6)),
+        "convert_to_messy": lambda: HTMLToMarkdownConverter().convert_to_messy(simplified_html),
+    }
+
+
+def environment() -> Dict[str, str]:
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python 3.7
+        def version(name):
+            return "unknown"
+    env = {"python": platform.python_version(), "platform": platform.platform(), "html_parser": parsers.html_parser}
+    for package in ("beautifulsoup4", "markdownify", "html2markdown", "lxml"):
+        try:
+            env[package] = version(package)
+        except Exception:
+            env[package] = "not installed"
+    return env
+
+
+def bench_run(seed: int, scale: int, repeat: int) -> dict:
+    """Time every stage on every shape of synthetic topic, keeping the best of `repeat` runs."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for shape in SHAPES:
+            html = synthetic_topic(shape, seed, scale)
+            for stage, function in timed_stages(html, Path(tmp)).items():
+                seconds = best_time(function, repeat)
+                results[f"{stage}/{shape}"] = seconds
+                print(f"{stage + '/' + shape:40} {seconds:8.4f}s", file=sys.stderr)
+    return {
+        "version": BASELINE_VERSION,
+        "settings": {"seed": seed, "scale": scale, "repeat": repeat},
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def bench_compare(baseline: dict, current: dict, threshold: float, min_seconds: float) -> List[Tuple[str, float, float]]:
+    """Print how each timing moved and return the regressions: slower by more than threshold (a
+    fraction of the baseline) and by more than min_seconds."""
+    corpus = [(run["settings"]["seed"], run["settings"]["scale"]) for run in (baseline, current)]
+    if corpus[0] != corpus[1]:
+        raise ValueError(f"Runs used different corpora (seed, scale): {corpus[0]} vs {corpus[1]}")
+    regressions = []
+    for name, before in sorted(baseline["results"].items()):
+        after = current["results"].get(name)
+        if after is None:
+            print(f"{name:40} missing from the current run")
+            continue
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold and after - before > min_seconds:
+            regressions.append((name, before, after))
+            flag = "  REGRESSION"
+        print(f"{name:40} {before:8.4f}s -> {after:8.4f}s {change:+7.1%}{flag}")
+    for name in sorted(set(current["results"]) - set(baseline["results"])):
+        print(f"{name:40} new, {current['results'][name]:.4f}s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the in-process conversion stages.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    links = commands.add_parser("links", help="Compare link handling on a link-dense document.")
+    links.add_argument("--links", type=int, default=1000, help="Number of links in the document.")
+    links.add_argument("--repeat", type=int, default=5, help="Number of timed runs; the best is reported.")
+    run = commands.add_parser("run", help="Time the stages on a synthetic corpus and write the results as JSON.")
+    run.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus.")
+    run.add_argument("--scale", type=int, default=1, help="Size multiplier for the synthetic documents.")
+    run.add_argument("--repeat", type=int, default=5, help="Number of timed runs; the best is recorded.")
+    run.add_argument("--html_parser", choices=parsers.HTML_PARSERS, default="html.parser", help="BeautifulSoup parser to time.")
+    run.add_argument("--output", type=Path, help="File for the results; printed if omitted.")
+    compare = commands.add_parser("compare", help="Flag stages that got slower than in a baseline.")
+    compare.add_argument("baseline", type=Path, help="Results of an earlier run.")
+    compare.add_argument("current", type=Path, help="Results of the run to check.")
+    compare.add_argument("--threshold", type=float, default=0.1, help="Slowdown, as a fraction, that counts as a regression.")
+    compare.add_argument("--min_seconds", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds.")
+    args = parser.parse_args()
+    if args.command == "links":
+        bench_links(args.links, args.repeat)
+    elif args.command == "run":
+        parsers.set_html_parser(args.html_parser)
+        results = json.dumps(bench_run(args.seed, args.scale, args.repeat), indent=2)
+        if args.output:
+            args.output.write_text(results + "\n")
+        else:
+            print(results)
+    elif args.command == "compare":
+        baseline = json.loads(args.baseline.read_text())
+        current = json.loads(args.current.read_text())
+        regressions = bench_compare(baseline, current, args.threshold, args.min_seconds)
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
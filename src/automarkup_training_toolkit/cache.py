@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+
+
+class ArtifactCache:
+    """A content-addressed store of converter outputs shared between runs and output directories.
+
+    Entries are keyed on the input file's bytes and the converter's identity, and live under
+    cache_dir/<2 hex digits>/<digest>. Reading an entry refreshes its mtime, so when the cache grows
+    beyond max_size bytes the least recently used entries are evicted first.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(input_file: Path, converter: str, options: dict, version: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps([converter, options, version], sort_keys=True, default=str).encode())
+        digest.update(b"\0")
+        with open(input_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def get(self, key: str, output_file: Path) -> bool:
+        """Copy the entry for key to output_file, returning False on a miss."""
+        entry = self._path(key)
+        try:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(entry, output_file)
+            os.utime(entry)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key: str, output_file: Path):
+        entry = self._path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".tmp-")
+        os.close(fd)
+        shutil.copyfile(output_file, tmp)
+        os.replace(tmp, entry)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += entry.stat().st_size
+            if self._size > self.max_size:
+                self.evict()
+
+    def _entries(self):
+        for entry in self.cache_dir.glob("??/*"):
+            if not entry.name.startswith(".tmp-"):
+                yield entry
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_size. Callers hold self._lock."""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+        size = sum(size for _, size, _ in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+            try:
+                entry.unlink()
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        self._size = size
+
+    def take_stats(self) -> Dict[str, int]:
+        """Return the hit, miss and eviction counts since the last call and reset them."""
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+            self.hits = self.misses = self.evictions = 0
+        return stats
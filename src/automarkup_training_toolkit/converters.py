@@ -1,27 +1,117 @@
 
 
+from contextlib import nullcontext
+import os
 from pathlib import Path
 import shutil
 import subprocess
-from typing import Dict, List, Optional, Union
-from xml.dom import minidom
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+from automarkup_training_toolkit.cache import ArtifactCache
+from automarkup_training_toolkit import dita_html, tools
+from automarkup_training_toolkit.manifest import BuildManifest
+from automarkup_training_toolkit.profiling import Profiler
 from automarkup_training_toolkit.html2markdown import HTMLToMarkdownConverter
 
-from automarkup_training_toolkit.simplify_html import simplify_html
-from automarkup_training_toolkit.html_to_messy import html_to_messy
+from automarkup_training_toolkit import parsers
+from automarkup_training_toolkit.xml_filter import remove_elements
+from automarkup_training_toolkit.simplify_html import simplify_html, settings as simplify_settings
+from automarkup_training_toolkit.html_to_messy import html_to_messy, html_to_messy_many, stable_seed, settings as messy_settings
 
 
 class Converter:
+    # Bump when a change to the converter changes its output, so cached artifacts are not reused.
+    version = "1"
+    # Shared artifact cache, set up by the command line; None disables caching.
+    cache: Optional[ArtifactCache] = None
+    # The topic's build manifest, set by pipeline.build_converters; None rebuilds only missing outputs.
+    manifest: Optional[BuildManifest] = None
+    # Profiler for the in-process steps, set up by --profile; None profiles nothing.
+    profiler: Optional[Profiler] = None
+
     def __init__(self, output_dir: Path, base_name: str, transformations: Dict[str, Path], dependent_key: Optional[str]=None):
         self.output_dir = output_dir
         self.base_name = base_name
         self.transformations = transformations
         self.dependent_key = dependent_key
         self.output_file = self.output_dir / self.get_output_filename()
+        self._fingerprint: Optional[Tuple[Path, str]] = None
+        # How output_file came about in this run: "converted", "cached" or "skipped" as up to date.
+        self.outcome: Optional[str] = None
 
     def convert(self):
-        print(self.__class__.__name__)
-        print(self.transformations)
+        self.resolve_input()
+        if self.needs_conversion():
+            self._convert()
+            self.record_output()
+        self.transformations[self.get_key()] = self.output_file
+
+    def needs_conversion(self) -> bool:
+        """Return True unless output_file is up to date or could be restored from the cache."""
+        if self.output_file.exists() and self.is_current():
+            self.outcome = self.outcome or "skipped"
+            return False
+        if self.restore_from_cache():
+            self.outcome = "cached"
+            self.record_in_manifest()
+            return False
+        return True
+
+    def cache_options(self) -> dict:
+        """Options and settings that change this converter's output, as part of its fingerprint."""
+        return {}
+
+    def fingerprint(self) -> Optional[str]:
+        """Digest of the input file and of everything about this converter that shapes its output."""
+        if self.input_file is None:
+            return None
+        if self._fingerprint is None or self._fingerprint[0] != self.input_file:
+            key = ArtifactCache.key(self.input_file, self.__class__.__name__, self.cache_options(), self.version)
+            self._fingerprint = (self.input_file, key)
+        return self._fingerprint[1]
+
+    def is_current(self) -> bool:
+        """Whether output_file was built from the current input and settings, as far as the manifest knows."""
+        if self.manifest is None:
+            return True
+        fingerprint = self.fingerprint()
+        return fingerprint is None or self.manifest.get(self.output_file) == fingerprint
+
+    def cache_key(self) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return self.fingerprint()
+
+    def restore_from_cache(self) -> bool:
+        key = self.cache_key()
+        return key is not None and self.cache.get(key, self.output_file)
+
+    def store_in_cache(self):
+        key = self.cache_key()
+        if key is not None and self.output_file.exists():
+            self.cache.put(key, self.output_file)
+
+    def record_in_manifest(self):
+        fingerprint = self.fingerprint()
+        if self.manifest is not None and fingerprint is not None and self.output_file.exists():
+            self.manifest.record(self.output_file, fingerprint)
+
+    def discard_output(self):
+        """Remove an out-of-date output_file before a batch, so only outputs the batch writes get recorded."""
+        try:
+            self.output_file.unlink()
+        except FileNotFoundError:
+            pass
+
+    def record_output(self):
+        """Store a freshly built output_file in the cache and the manifest."""
+        if self.output_file.exists():
+            self.outcome = "converted"
+        self.store_in_cache()
+        self.record_in_manifest()
+
+    def resolve_input(self):
         if self.dependent_key:
             self.input_file = Path(self.transformations[self.dependent_key])
         else:
@@ -29,9 +119,12 @@ class Converter:
         if self.dependent_key and isinstance(self.transformations.get(self.dependent_key), Converter):
             self.input_file = Path(self.transformations[self.dependent_key])
             assert self.input_file.exists(), f'File {self.input_file} does not exist'
-        if not self.output_file.exists():
-            self._convert()
-        self.transformations[self.get_key()] = self.output_file
+
+    def profiled(self):
+        """Context manager around an in-process step, profiling it when a profiler is set up."""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.measure(self.__class__.__name__, str(self.input_file))
 
     def get_output_filename(self):
         raise NotImplementedError
@@ -43,50 +136,133 @@ class Converter:
     def get_key(cls):
         return cls.__name__
 
+BATCH_MAP_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE map PUBLIC "-//OASIS//DTD DITA Map//EN" "map.dtd">
+<map>
+%s
+</map>
+"""
+
+
 class DitaConverter(Converter):
     def __init__(self, output_dir: Path, base_name: str, format: str, globs: Union[str, List[str]], transformations: dict, dependent_key: Optional[str]=None):
         super().__init__(output_dir, base_name, transformations, dependent_key)
         self.format = format
         self.globs = globs if isinstance(globs, list) else [globs]
 
+    def cache_options(self) -> dict:
+        return {"format": self.format}
+
     def _convert(self):
+        if self._convert_natively():
+            return
         self.input_file = self.input_file.resolve()
         output_dir = self.output_file.with_suffix(".tmp")
-        command = f'dita --input={self.input_file} --output={output_dir} --format={self.format}'
-        print(command)
-        subprocess.run(command, shell=True, check=True)
+        tools.run(['dita', f'--input={self.input_file}', f'--output={output_dir}', f'--format={self.format}'])
         self.globs += [f'*/{glob}' for glob in self.globs]
         for glob in self.globs:
             matching = list(output_dir.glob(glob))
             if matching:
                 matching[0].rename(self.output_file)
                 shutil.rmtree(output_dir)
+                self._postprocess()
                 return
         raise Exception(f'No matching file found for {self.input_file} in {output_dir} using {self.globs}')
 
+    def _convert_natively(self) -> bool:
+        """Hook for writing output_file without DITA-OT; returns False when DITA-OT has to run."""
+        return False
+
+    def _postprocess(self):
+        """Hook for changes to the DITA-OT output once it is in place at output_file."""
+
+    @classmethod
+    def convert_batch(cls, converters: List["DitaConverter"]):
+        """Convert several topics with a single DITA-OT run per format.
+
+        The topics are listed by absolute URI in a temporary map outside the input corpus, and
+        DITA-OT keeps their layout below their common parent directory in its output, which is then
+        moved to each converter's output_file. Out-of-date outputs are removed first, so converters whose output the batch
+        did not produce are left without one; a later convert() call handles them one topic at a time.
+        """
+        by_format: Dict[str, List[DitaConverter]] = {}
+        for converter in converters:
+            converter.resolve_input()
+            if not converter.needs_conversion():
+                continue
+            if converter._convert_natively():
+                converter.record_output()
+            else:
+                converter.discard_output()
+                by_format.setdefault(converter.format, []).append(converter)
+        for format, pending in by_format.items():
+            try:
+                cls._run_batch(format, pending)
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f'DITA-OT batch for {format} failed, converting its {len(pending)} topics one at a time: {e}')
+            for converter in pending:
+                converter.record_output()
+        for converter in converters:
+            if converter.output_file.exists():
+                converter.convert()
+
+    @staticmethod
+    def _run_batch(format: str, converters: List["DitaConverter"]):
+        input_files = [converter.input_file.resolve() for converter in converters]
+        root = Path(os.path.commonpath([input_file.parent for input_file in input_files]))
+        relatives = [input_file.relative_to(root) for input_file in input_files]
+        topicrefs = "\n".join(f'  <topicref href="{input_file.as_uri()}"/>' for input_file in input_files)
+        # The map goes to a scratch directory, so the input corpus may be read-only and stays clean.
+        work_dir = Path(tempfile.mkdtemp(prefix='dita-batch-'))
+        try:
+            ditamap = work_dir / 'batch.ditamap'
+            ditamap.write_text(BATCH_MAP_TEMPLATE % topicrefs)
+            output_dir = work_dir / 'out'
+            tools.run(['dita', f'--input={ditamap}', f'--output={output_dir}', f'--format={format}'])
+            topic_dir = DitaConverter._batch_output_dir(output_dir, root, converters, relatives)
+            for converter, input_file, relative in zip(converters, input_files, relatives):
+                for suffix in converter._output_suffixes():
+                    candidate = topic_dir / relative.with_suffix(suffix)
+                    if candidate.exists():
+                        converter.output_file.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.move(str(candidate), str(converter.output_file))
+                        converter._postprocess()
+                        break
+                else:
+                    print(f'No batch output found for {input_file} in {output_dir}')
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _output_suffixes(self) -> List[str]:
+        return list(dict.fromkeys(Path(glob).suffix for glob in self.globs))
+
+    @staticmethod
+    def _batch_output_dir(output_dir: Path, root: Path, converters: List["DitaConverter"], relatives: List[Path]) -> Path:
+        """Find where DITA-OT put the topics under root in output_dir.
+
+        With topics outside the map's directory, DITA-OT lays its output out relative to the common
+        base directory of the map and the topics, which keeps root's path below that base."""
+        for base in [root, *root.parents]:
+            topic_dir = output_dir / root.relative_to(base)
+            if any((topic_dir / relative.with_suffix(suffix)).exists()
+                   for converter, relative in zip(converters, relatives) for suffix in converter._output_suffixes()):
+                return topic_dir
+        return output_dir
+
 
 class SimplifiedDitaConverter(DitaConverter):
+    # Elements removed from the DITA-OT output
+    elements_to_delete = ["related-links", "prolog"]
+
     def __init__(self, output_dir: Path, base_name: str, transformations: dict, dependent_key: str="Original"):
         super().__init__(output_dir, base_name, 'dita', ["*.xml", "tasks/*.xml", "*.dita", "tasks/*.dita"], transformations, dependent_key)
 
-    def _convert(self):
-        res = super()._convert()
-        self._remove_elements(["related-links", "prolog"])
-        return res
-    
-    def _remove_elements(self, elements_to_delete: List[str]):
-        """Load a DITA document and remove the related-links element."""
-        with self.output_file.open() as f:
-            tree = minidom.parse(f)
-        # TODO: speed this up by removing all elements at once
-        for element_to_delete in elements_to_delete:
-            self._remove_element_type(element_to_delete, tree)
-        with open(self.output_file, "w") as f:
-            tree.writexml(f)
-
-    def _remove_element_type(self, tagName: str, dom: minidom.Document):
-        for element in dom.getElementsByTagName(tagName):
-            element.parentNode.removeChild(element)
+    def cache_options(self) -> dict:
+        return dict(super().cache_options(), elements_to_delete=self.elements_to_delete)
+
+    def _postprocess(self):
+        with self.profiled():
+            remove_elements(self.output_file, self.output_file, self.elements_to_delete)
 
     def get_output_filename(self):
         return f'{self.base_name}.dita'
@@ -101,35 +277,122 @@ class DitaMarkdownConverter(DitaConverter):
 
 
 class DitaHtmlConverter(DitaConverter):
+    # Render topics with dita_html where it supports them, and with DITA-OT otherwise; set from --native_html.
+    native = False
+    # Topics per renderer and reasons for falling back to DITA-OT, reported through take_stats
+    renderers: Dict[str, int] = {}
+    fallbacks: Dict[str, int] = {}
+    _stats_lock = threading.Lock()
+
     def __init__(self, output_dir: Path, base_name: str, transformations: dict, dependent_key: Optional[str]=None):
         super().__init__(output_dir, base_name, 'html5', ["*.html", "tasks/*.html"], transformations, dependent_key)
 
+    def cache_options(self) -> dict:
+        options = super().cache_options()
+        if self.native:
+            options["native_html"] = dita_html.VERSION
+        return options
+
+    def _convert_natively(self) -> bool:
+        if not self.native:
+            return False
+        try:
+            with self.profiled():
+                html = dita_html.render_html(self.input_file)
+        except dita_html.UnsupportedDita as e:
+            print(f'{self.input_file}: HTML from DITA-OT, {e}')
+            self._count("dita-ot", str(e))
+            return False
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.output_file.write_text(html)
+        print(f'{self.input_file}: HTML rendered natively')
+        self._count("native")
+        return True
+
+    @classmethod
+    def _count(cls, renderer: str, reason: Optional[str]=None):
+        with cls._stats_lock:
+            cls.renderers[renderer] = cls.renderers.get(renderer, 0) + 1
+            if reason:
+                cls.fallbacks[reason] = cls.fallbacks.get(reason, 0) + 1
+
+    @classmethod
+    def take_stats(cls) -> Dict[str, Dict[str, int]]:
+        """Collect and reset the renderer counts, like ArtifactCache.take_stats."""
+        with cls._stats_lock:
+            stats = {"html_renderer": cls.renderers, "html_fallback": cls.fallbacks}
+            cls.renderers, cls.fallbacks = {}, {}
+        return stats
+
     def get_output_filename(self):
         return f'{self.base_name}.raw.html'
 
 
 class HtmlToSimplifiedHtmlConverter(Converter):
+    # How simplify_html checks that the Markdown rendering is unchanged; see simplify_html.VERIFY_MODES.
+    verify = "full"
+    verify_sample_rate = 0.1
+    # Where failed verifications leave their Markdown renderings; None for simplify_html.DIAGNOSTICS_DIR.
+    diagnostics_dir: Optional[Path] = None
+
     def __init__(self, output_dir: Path, base_name: str, transformations: dict, dependent_key: Optional[str]=None):
         super().__init__(output_dir, base_name, transformations, dependent_key)
 
     def _convert(self):
         assert self.input_file
-        print("QQQ", self.input_file, self.input_file.exists(), self.output_file, self.output_file.exists())
-        simplify_html(self.input_file, self.output_file)
+        with self.profiled():
+            simplify_html(self.input_file, self.output_file, verify=self.verify, sample_rate=self.verify_sample_rate,
+                          diagnostics_dir=self.diagnostics_dir)
+
+    def cache_options(self) -> dict:
+        return simplify_settings()
 
     def get_output_filename(self):
         return f'{self.base_name}.html'
 
 
 class HtmlToMessyConverter(Converter):
-    def __init__(self, output_dir: Path, base_name: str, transformations: dict, dependent_key: Optional[str]=None, seed: Optional[int]=None):
+    # 2: seeds from stable_seed instead of the per-process hash()
+    # 3: seeds from the topic's relative path instead of its name
+    version = "3"
+
+    def __init__(self, output_dir: Path, base_name: str, transformations: dict, dependent_key: Optional[str]=None, seed: Optional[int]=None,
+                 topic_path: Optional[str]=None):
         self.seed=seed
+        # The topic's path relative to the input directory, in POSIX form; defaults to base_name
+        self.topic_path = topic_path or base_name
         super().__init__(output_dir, base_name, transformations, dependent_key)
 
+    def cache_options(self) -> dict:
+        return dict(messy_settings(), seed=self.seed, topic=self.topic_path)
+
+    def messy_seed(self) -> int:
+        """The variant's seed, from the topic's relative path and the variant index, so every process and
+        machine writes the same text, and topics of the same name in different directories do not."""
+        return stable_seed(self.topic_path, self.seed)
+
     def _convert(self):
         assert self.input_file
-        seed = hash(f"{self.input_file}_{self.seed}")
-        html_to_messy(self.input_file, self.output_file, {"seed": seed})
+        with self.profiled():
+            html_to_messy(self.input_file, self.output_file, {"seed": self.messy_seed()})
+
+    @classmethod
+    def convert_batch(cls, converters: List["HtmlToMessyConverter"]):
+        """Write the variants for several seeds, parsing each input document only once."""
+        variants: Dict[Path, List[HtmlToMessyConverter]] = {}
+        for converter in converters:
+            converter.resolve_input()
+            if converter.needs_conversion():
+                variants.setdefault(converter.input_file, []).append(converter)
+        for input_file, pending in variants.items():
+            with pending[0].profiled():
+                texts = html_to_messy_many(input_file, [converter.messy_seed() for converter in pending])
+            for converter, text in zip(pending, texts):
+                converter.output_file.parent.mkdir(parents=True, exist_ok=True)
+                converter.output_file.write_text(text)
+                converter.record_output()
+        for converter in converters:
+            converter.convert()
 
     def get_output_filename(self):
         return f'{self.base_name}.{self.seed}.messy'
@@ -141,22 +404,70 @@ class HtmlToMessYEConverter(HtmlToMessyConverter):
     
         #  To do: pass through a Conversion Profile
         converter = HTMLToMarkdownConverter()
-        text = converter.convert_to_messy(content)
+        with self.profiled():
+            text = converter.convert_to_messy(content)
         self.output_file.write_text(text)
 
+    def cache_options(self) -> dict:
+        return {"html_parser": parsers.html_parser}
+
     def get_output_filename(self):
         return f'{self.base_name}.messYE'
 
 
 
+PANDOC_MULTI_FILTER = Path(__file__).with_name('pandoc_multi.lua')
+
+
 class PandocConverter(Converter):
     def __init__(self, output_dir: Path, base_name: str, format: str, transformations: dict, dependent_key: Optional[str]=None):
         self.format = format
         super().__init__(output_dir, base_name, transformations, dependent_key)
 
     def _convert(self):
-        command = f'pandoc {self.input_file} -o {self.output_file} -t {self.format}'
-        subprocess.run(command, shell=True, check=True)
+        tools.run(['pandoc', self.input_file, '-o', self.output_file, '-t', self.format])
+
+    @classmethod
+    def convert_batch(cls, converters: List["PandocConverter"]):
+        """Render several formats, possibly of several documents, from one pandoc run.
+
+        pandoc_multi.lua parses each input document once and writes every requested format from
+        that parse. Converters whose output is still missing afterwards fall back to their own
+        pandoc run in convert().
+        """
+        outputs: Dict[Path, List[PandocConverter]] = {}
+        for converter in converters:
+            converter.resolve_input()
+            if converter.needs_conversion():
+                outputs.setdefault(converter.input_file, []).append(converter)
+        if outputs:
+            lines = []
+            for input_file, pending in outputs.items():
+                fields = [str(input_file)]
+                for converter in pending:
+                    converter.discard_output()
+                    converter.output_file.parent.mkdir(parents=True, exist_ok=True)
+                    fields += [converter.format, str(converter.output_file)]
+                lines.append("\t".join(fields))
+            fd, manifest = tempfile.mkstemp(prefix='pandoc-batch-', suffix='.tsv')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write("\n".join(lines) + "\n")
+                command = ['pandoc', '--from=html', '--to=plain', f'--lua-filter={PANDOC_MULTI_FILTER}',
+                           f'--metadata=manifest:{manifest}', '--output=/dev/null']
+                tools.run(command, stdin=subprocess.DEVNULL)
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f'Pandoc batch failed, falling back to one format at a time: {e}')
+            finally:
+                os.remove(manifest)
+            for pending in outputs.values():
+                for converter in pending:
+                    converter.record_output()
+        for converter in converters:
+            converter.convert()
+
+    def cache_options(self) -> dict:
+        return {"format": self.format}
 
     def get_output_filename(self):
         return f'{self.base_name}.{self.format}'
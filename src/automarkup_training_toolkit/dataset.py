@@ -0,0 +1,240 @@
+"""The two layouts of the training data: the metrics_ready tree, and a packed form of
+size-bounded JSONL shards with an offset index.
+
+Each record holds one plain-text variant of a topic together with the topic's markup:
+
+    {"topic": "topic1", "variant": "1.messy", "markup": "<topic ...>", "html": "<html ...>", "text": "..."}
+
+Shards are named shard-00000.jsonl, shard-00001.jsonl, ... and hold one record per line. With
+compression each record is its own zstd frame, so shard-00000.jsonl.zst still streams with
+zstdcat while single records can be read from their offset. index.jsonl lists
+[topic, variant, shard, offset, length] for every record.
+
+    python -m automarkup_training_toolkit.dataset out/dataset --topic topic1 --variant 1.messy
+"""
+import argparse
+import io
+import json
+import os
+from pathlib import Path
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from automarkup_training_toolkit.fileutils import clone_or_copy
+
+try:
+    import zstandard
+except ImportError:  # optional, see the "zstd" extra
+    zstandard = None
+
+INDEX_NAME = "index.jsonl"
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise ValueError("Compressed datasets need the zstandard package; try `pip install zstandard`")
+
+
+class ShardWriter:
+    """Append records to shards of at most max_shard_size bytes, indexing them as they go.
+
+    Shards are written under a temporary name and renamed when full, and the index is written on
+    close, so readers never see a partial dataset. Shards and an index already in dataset_dir
+    are removed first.
+    """
+
+    def __init__(self, dataset_dir: Path, max_shard_size: int=256 << 20, compress: bool=False):
+        if compress:
+            require_zstandard()
+        self.dataset_dir = Path(dataset_dir)
+        self.max_shard_size = max_shard_size
+        self.compressor = zstandard.ZstdCompressor() if compress else None
+        self.suffix = ".jsonl.zst" if compress else ".jsonl"
+        self.index: List[Tuple[str, str, str, int, int]] = []
+        self.shards = 0
+        self.shard_name: Optional[str] = None
+        self.shard = None
+        self.shard_size = 0
+        self.dataset_dir.mkdir(parents=True, exist_ok=True)
+        for old in self.dataset_dir.glob("shard-*.jsonl*"):
+            old.unlink()
+        try:
+            (self.dataset_dir / INDEX_NAME).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _tmp_path(self, name: str) -> Path:
+        return self.dataset_dir / f".{name}.tmp"
+
+    def _finish_shard(self):
+        if self.shard is None:
+            return
+        self.shard.close()
+        os.replace(self._tmp_path(self.shard_name), self.dataset_dir / self.shard_name)
+        self.shard = None
+
+    def write(self, record: Dict[str, str]):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if self.compressor:
+            data = self.compressor.compress(data)
+        if self.shard is not None and self.shard_size + len(data) > self.max_shard_size:
+            self._finish_shard()
+        if self.shard is None:
+            self.shard_name = f"shard-{self.shards:05d}{self.suffix}"
+            self.shards += 1
+            self.shard = open(self._tmp_path(self.shard_name), "wb")
+            self.shard_size = 0
+        self.index.append((record["topic"], record["variant"], self.shard_name, self.shard_size, len(data)))
+        self.shard.write(data)
+        self.shard_size += len(data)
+
+    def close(self):
+        self._finish_shard()
+        tmp = self._tmp_path(INDEX_NAME)
+        with open(tmp, "w") as f:
+            for entry in self.index:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.dataset_dir / INDEX_NAME)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self.shard is not None:
+            self.shard.close()
+
+
+class DatasetReader:
+    """Read a dataset written by ShardWriter, streaming it in order or fetching single records."""
+
+    def __init__(self, dataset_dir: Path):
+        self.dataset_dir = Path(dataset_dir)
+        self._index: Optional[Dict[Tuple[str, str], Tuple[str, int, int]]] = None
+
+    @property
+    def index(self) -> Dict[Tuple[str, str], Tuple[str, int, int]]:
+        if self._index is None:
+            self._index = {}
+            with open(self.dataset_dir / INDEX_NAME) as f:
+                for line in f:
+                    topic, variant, shard, offset, length = json.loads(line)
+                    self._index[(topic, variant)] = (shard, offset, length)
+        return self._index
+
+    def shards(self) -> List[Path]:
+        return sorted(self.dataset_dir.glob("shard-*.jsonl*"))
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        for shard in self.shards():
+            with open(shard, "rb") as raw:
+                if shard.suffix == ".zst":
+                    require_zstandard()
+                    raw = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                    yield json.loads(line)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self.index
+
+    def keys(self) -> List[Tuple[str, str]]:
+        return list(self.index)
+
+    def get(self, topic: str, variant: str) -> Dict[str, str]:
+        shard, offset, length = self.index[(topic, variant)]
+        with open(self.dataset_dir / shard, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if shard.endswith(".zst"):
+            require_zstandard()
+            data = zstandard.ZstdDecompressor().decompress(data)
+        return json.loads(data)
+
+
+def copy_files_metrics_ready(formats_dir: Path, metrics_ready_dir: Path, skip: Optional[Set[str]]=None):
+    """Lay out each plain-text variant next to its topic's DITA and HTML markup and the prompt.
+
+    Files are cloned rather than copied where the filesystem allows, and each topic's markup is
+    looked up once for all of its variants.
+    """
+    prompt = Path("prompt.txt")
+    prompted = set()
+
+    for plain_text_dir in formats_dir.glob("*/plain_text"):
+        topic_dir = plain_text_dir.parent
+        if skip and topic_dir.name in skip:
+            continue
+        filenames = list(plain_text_dir.glob("*"))
+        if not filenames:
+            continue
+        dita = list((topic_dir / "markup").glob("*.dita"))[0]
+        html = list((topic_dir / "markup").glob("*.html"))[0]
+        for filename in filenames:
+            new_filename = Path(str(metrics_ready_dir / filename.name.split(".")[0] / filename.name ) + ".txt")
+            if new_filename.parent not in prompted:
+                new_filename.parent.mkdir(parents=True, exist_ok=True)
+                clone_or_copy(prompt, new_filename.parent / prompt.name)
+                prompted.add(new_filename.parent)
+            clone_or_copy(filename, new_filename)
+            clone_or_copy(dita, new_filename.with_suffix(".xml"))
+            clone_or_copy(html, new_filename.with_suffix(".html"))
+
+
+def write_dataset(formats_dir: Path, dataset_dir: Path, skip: Optional[Set[str]]=None,
+                  max_shard_size: int=256 << 20, compress: bool=False) -> int:
+    """Pack the plain-text variants and markup of every topic in formats_dir into a dataset.
+
+    This is the packed counterpart of the metrics_ready directory; it returns the number of records.
+    """
+    topic_dirs = [plain_text_dir.parent for plain_text_dir in sorted(formats_dir.glob("*/plain_text"))]
+    return write_topics([topic_dir for topic_dir in topic_dirs if not (skip and topic_dir.name in skip)],
+                        dataset_dir, max_shard_size, compress)
+
+
+def write_topics(topic_dirs: Iterable[Path], dataset_dir: Path, max_shard_size: int=256 << 20, compress: bool=False) -> int:
+    """Pack the given topic directories of formats trees into a dataset, in order."""
+    prompt = Path("prompt.txt")
+    count = 0
+    with ShardWriter(dataset_dir, max_shard_size, compress) as writer:
+        for topic_dir in topic_dirs:
+            plain_text_dir = topic_dir / "plain_text"
+            filenames = sorted(plain_text_dir.glob("*"))
+            if not filenames:
+                continue
+            markup = list((topic_dir / "markup").glob("*.dita"))[0].read_text()
+            html = list((topic_dir / "markup").glob("*.html"))[0].read_text()
+            for filename in filenames:
+                topic, _, variant = filename.name.partition(".")
+                writer.write({"topic": topic, "variant": variant, "markup": markup, "html": html,
+                              "text": filename.read_text()})
+                count += 1
+    if prompt.exists():
+        clone_or_copy(prompt, Path(dataset_dir) / prompt.name)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a packed dataset or print one of its records.")
+    parser.add_argument("dataset_dir", type=Path, help="Directory written with --output_format dataset")
+    parser.add_argument("--topic", type=str, help="Topic of the record to print")
+    parser.add_argument("--variant", type=str, help="Variant of the record to print")
+    args = parser.parse_args()
+    reader = DatasetReader(args.dataset_dir)
+    if args.topic:
+        try:
+            record = reader.get(args.topic, args.variant)
+        except KeyError:
+            print(f"No record for topic {args.topic!r}, variant {args.variant!r}")
+            sys.exit(1)
+        print(json.dumps(record, indent=2, ensure_ascii=False))
+        return
+    topics = {topic for topic, _ in reader.keys()}
+    print(f"{len(reader)} records of {len(topics)} topics in {len(reader.shards())} shard(s)")
+
+
+if __name__ == "__main__":
+    main()
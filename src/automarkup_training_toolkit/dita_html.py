@@ -0,0 +1,461 @@
+"""An in-process DITA topic to HTML5 renderer for the common topic vocabulary.
+
+render_html covers topic, concept, task and reference topics built from the base block, list,
+table, inline and task elements, writing the markup DITA-OT's html5 transtype writes for them,
+as far as HtmlToSimplifiedHtmlConverter keeps it. Anything else raises UnsupportedDita so the
+topic can be left to DITA-OT: elements outside that vocabulary (which includes specialisations,
+as they bring their own element names), unresolved conref and keyref attributes, footnotes,
+cross references whose link text DITA-OT would have to generate, and so on.
+
+    python -m automarkup_training_toolkit.dita_html topic.dita > topic.html
+
+The renderer is experimental: it follows DITA-OT's html5 markup by reading, not by testing
+against DITA-OT. Before turning on --native_html for a corpus, compare both routes through the
+later stages on the simplified DITA the pipeline feeds them, with DITA-OT on the PATH:
+
+    python -m automarkup_training_toolkit.dita_html --compare out/formats
+
+This renders every topic both ways, runs each HTML through simplify_html, html_to_messy and
+convert_to_messy, and reports the topics where any of those outputs differ.
+"""
+import argparse
+from pathlib import Path
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+# Bump when a change to the renderer changes its output, so outputs built with it are rebuilt.
+VERSION = "1"
+
+DOCTYPE = '<!DOCTYPE html\n  SYSTEM "about:legacy-compat">\n'
+TOPICS = {"topic": "body", "concept": "conbody", "task": "taskbody", "reference": "refbody"}
+# Attributes that DITA-OT's preprocessing resolves; left in place, they point at content we do not have.
+UNRESOLVED_ATTRS = ("conref", "conrefend", "conkeyref", "keyref", "conaction")
+
+# DITA element -> (HTML element, class, starts a new line after it in DITA-OT's output)
+ELEMENTS: Dict[str, Tuple[str, str, bool]] = {
+    "p": ("p", "p", True),
+    "ul": ("ul", "ul", True),
+    "ol": ("ol", "ol", True),
+    "li": ("li", "li", True),
+    "sl": ("ul", "sl simple", True),
+    "sli": ("li", "sli", True),
+    "dl": ("dl", "dl", True),
+    "dt": ("dt", "dt dlterm", True),
+    "dd": ("dd", "dd", True),
+    "lq": ("blockquote", "lq", True),
+    "pre": ("pre", "pre", True),
+    "div": ("div", "div", True),
+    "bodydiv": ("div", "bodydiv", True),
+    "sectiondiv": ("div", "sectiondiv", True),
+    "ph": ("span", "ph", False),
+    "b": ("strong", "ph b", False),
+    "i": ("em", "ph i", False),
+    "u": ("u", "ph u", False),
+    "tt": ("span", "ph tt", False),
+    "sup": ("sup", "ph sup", False),
+    "sub": ("sub", "ph sub", False),
+    "codeph": ("code", "ph codeph", False),
+    "filepath": ("span", "ph filepath", False),
+    "uicontrol": ("span", "ph uicontrol", False),
+    "wintitle": ("span", "keyword wintitle", False),
+    "keyword": ("span", "keyword", False),
+    "cmdname": ("span", "keyword cmdname", False),
+    "option": ("span", "keyword option", False),
+    "parmname": ("span", "keyword parmname", False),
+    "apiname": ("span", "keyword apiname", False),
+    "varname": ("var", "keyword varname", False),
+    "userinput": ("kbd", "ph userinput", False),
+    "systemoutput": ("samp", "ph systemoutput", False),
+    "term": ("dfn", "term", False),
+    "cite": ("cite", "cite", False),
+    "cmd": ("span", "ph cmd", False),
+    "info": ("div", "itemgroup info", True),
+    "stepresult": ("div", "itemgroup stepresult", True),
+    "stepxmp": ("div", "itemgroup stepxmp", True),
+    "tutorialinfo": ("div", "itemgroup tutorialinfo", True),
+    "choices": ("ul", "ul choices", True),
+    "choice": ("li", "li choice", True),
+    "steps": ("ol", "ol steps", True),
+    "steps-unordered": ("ul", "ul steps-unordered", True),
+    "step": ("li", "li step", True),
+    "substep": ("li", "li substep", True),
+    "context": ("section", "section context", True),
+    "prereq": ("section", "section prereq", True),
+    "result": ("section", "section result", True),
+    "postreq": ("section", "section postreq", True),
+    "refsyn": ("section", "section refsyn", True),
+}
+# Elements DITA-OT leaves out of the html5 output by default
+DROPPED = {"indexterm", "index-base", "draft-comment", "required-cleanup", "data", "data-about", "titlealts"}
+NOTE_LABELS = {"note": "Note", "tip": "Tip", "important": "Important", "remember": "Remember",
+               "restriction": "Restriction", "attention": "Attention", "fastpath": "Fastpath"}
+
+
+class UnsupportedDita(ValueError):
+    """The topic uses something render_html does not render; DITA-OT has to convert it."""
+
+
+def escape(text: str, quote: bool=False) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.replace('"', "&quot;") if quote else text
+
+
+def html_href(href: str) -> str:
+    """Where DITA-OT points a link to a topic: .dita and .xml become .html and topic/element fragments topic__element."""
+    path, _, fragment = href.partition("#")
+    for suffix in (".dita", ".xml"):
+        if path.endswith(suffix):
+            path = path[:-len(suffix)] + ".html"
+    return f"{path}#{fragment.replace('/', '__')}" if fragment else path
+
+
+class HtmlRenderer:
+    def __init__(self):
+        self.out: List[str] = []
+        self.titles = 0
+        self.tables = 0
+        # The topic being rendered, whose id prefixes the ids of its elements, and its nesting depth
+        self.topic_id: Optional[str] = None
+        self.depth = 1
+
+    def render(self, root: ElementTree.Element) -> str:
+        if root.tag not in TOPICS:
+            raise UnsupportedDita(f"unsupported topic type <{root.tag}>")
+        title = root.find("title")
+        searchtitle = root.find("titlealts/searchtitle")
+        page_title = "".join((searchtitle if searchtitle is not None else title).itertext()) if title is not None else ""
+        lang = root.get("{http://www.w3.org/XML/1998/namespace}lang", "en")
+        self.out.append(f'{DOCTYPE}<html lang="{escape(lang, True)}"><head>'
+                        f'<meta http-equiv="Content-Type" content="text/html; charset=UTF-8"><meta charset="UTF-8">'
+                        f'<title>{escape(page_title.strip())}</title></head>'
+                        f'<body{self._id(root)}><main role="main"><article role="article" aria-labelledby="ariaid-title1">\n')
+        self._topic_content(root, 1)
+        self.out.append("</article></main></body></html>")
+        return "".join(self.out)
+
+    @staticmethod
+    def _id(element: ElementTree.Element, prefix: Optional[str]=None) -> str:
+        value = element.get("id")
+        if value is None:
+            return ""
+        return f' id="{escape(f"{prefix}__{value}" if prefix else value, True)}"'
+
+    def _check(self, element: ElementTree.Element):
+        for attr in UNRESOLVED_ATTRS:
+            if element.get(attr) is not None:
+                raise UnsupportedDita(f"unresolved {attr}")
+
+    def _topic_content(self, topic: ElementTree.Element, depth: int):
+        self._check(topic)
+        self.topic_id = topic.get("id")
+        self.depth = depth
+        self.titles += 1
+        title = topic.find("title")
+        if title is None:
+            raise UnsupportedDita("topic without a title")
+        self.out.append(f'<h{min(depth, 6)} class="title topictitle{depth}" id="ariaid-title{self.titles}">')
+        self._children(title)
+        self.out.append(f"</h{min(depth, 6)}>\n")
+        shortdesc = topic.find("shortdesc")
+        body = None
+        for child in topic:
+            if child.tag in ("title", "shortdesc", "titlealts"):
+                continue
+            if child.tag == "abstract":
+                raise UnsupportedDita("unsupported element <abstract>")
+            if child.tag == TOPICS[topic.tag] and body is None:
+                body = child
+            elif child.tag not in TOPICS:
+                raise UnsupportedDita(f"unsupported element <{child.tag}> in <{topic.tag}>")
+        if body is not None:
+            self._check(body)
+            self.out.append(f'<div class="body {body.tag}">' if body.tag != "body" else '<div class="body">')
+            if shortdesc is not None:
+                self._shortdesc(shortdesc)
+            self._children(body)
+            self.out.append("</div>\n")
+        elif shortdesc is not None:
+            self._shortdesc(shortdesc)
+        for child in topic:
+            if child.tag in TOPICS:
+                self.out.append(f'<article class="topic {child.tag} nested{depth}" aria-labelledby="ariaid-title{self.titles + 1}"{self._id(child)}>')
+                self._topic_content(child, depth + 1)
+                self.out.append("</article>\n")
+                self.topic_id = topic.get("id")
+                self.depth = depth
+
+    def _shortdesc(self, shortdesc: ElementTree.Element):
+        self.out.append('<p class="shortdesc">')
+        self._children(shortdesc)
+        self.out.append("</p>\n")
+
+    def _children(self, element: ElementTree.Element):
+        if element.text:
+            self.out.append(escape(element.text))
+        for child in element:
+            self._element(child)
+            if child.tail:
+                self.out.append(escape(child.tail))
+
+    def _element(self, element: ElementTree.Element):
+        tag = element.tag
+        if not isinstance(tag, str) or tag in DROPPED:
+            return
+        self._check(element)
+        if tag in ELEMENTS:
+            name, cls, block = ELEMENTS[tag]
+            self.out.append(f'<{name} class="{cls}"{self._id(element, self.topic_id)}>')
+            self._children(element)
+            self.out.append(f"</{name}>\n" if block else f"</{name}>")
+        elif tag == "substeps":
+            self.out.append(f'<ol class="ol substeps" type="a"{self._id(element, self.topic_id)}>')
+            self._children(element)
+            self.out.append("</ol>\n")
+        elif tag == "dlentry":
+            self._children(element)
+        elif tag == "section":
+            self._titled(element, "section", "section")
+        elif tag == "example":
+            self._titled(element, "div", "example")
+        elif tag == "fig":
+            self._titled(element, "figure", "fig fignone")
+        elif tag == "title":
+            raise UnsupportedDita("<title> outside a topic, section, figure or table")
+        elif tag == "codeblock":
+            self.out.append(f'<pre class="pre codeblock"{self._id(element, self.topic_id)}><code>')
+            self._children(element)
+            self.out.append("</code></pre>\n")
+        elif tag == "note":
+            self._note(element)
+        elif tag == "xref":
+            self._xref(element)
+        elif tag == "image":
+            self._image(element)
+        elif tag == "menucascade":
+            for i, child in enumerate(element):
+                if i:
+                    self.out.append('<abbr title="and then"> &gt; </abbr>')
+                self._element(child)
+        elif tag == "table":
+            self._table(element)
+        elif tag == "simpletable":
+            self._simpletable(element)
+        else:
+            raise UnsupportedDita(f"unsupported element <{tag}>")
+
+    def _titled(self, element: ElementTree.Element, name: str, cls: str):
+        """A section, example or figure, whose title becomes a heading or a figure caption."""
+        self.out.append(f'<{name} class="{cls}"{self._id(element, self.topic_id)}>')
+        if element.text:
+            self.out.append(escape(element.text))
+        for child in element:
+            if child.tag != "title":
+                self._element(child)
+            elif name == "figure":
+                self.out.append('<figcaption>')
+                self._children(child)
+                self.out.append("</figcaption>")
+            else:
+                level = min(self.depth + 1, 6)
+                self.out.append(f'<h{level} class="title sectiontitle">')
+                self._children(child)
+                self.out.append(f"</h{level}>\n")
+            if child.tail:
+                self.out.append(escape(child.tail))
+        self.out.append(f"</{name}>\n")
+
+    def _note(self, note: ElementTree.Element):
+        kind = note.get("type", "note")
+        if kind not in NOTE_LABELS:
+            raise UnsupportedDita(f'unsupported note type "{kind}"')
+        self.out.append(f'<div class="note {kind} note_{kind}"{self._id(note, self.topic_id)}>'
+                        f'<span class="note__title">{NOTE_LABELS[kind]}:</span> ')
+        self._children(note)
+        self.out.append("</div>\n")
+
+    def _xref(self, xref: ElementTree.Element):
+        href = xref.get("href")
+        has_text = (xref.text or "").strip() or len(xref)
+        if href is None:
+            raise UnsupportedDita("xref without href")
+        if not has_text and xref.get("scope") != "external":
+            raise UnsupportedDita("xref without link text")
+        if xref.get("scope") != "external":
+            href = html_href(href)
+        self.out.append(f'<a class="xref" href="{escape(href, True)}">')
+        if has_text:
+            for child in xref:
+                if child.tag == "desc":
+                    raise UnsupportedDita("xref with desc")
+            self._children(xref)
+        else:
+            self.out.append(escape(href))
+        self.out.append("</a>")
+
+    def _image(self, image: ElementTree.Element):
+        href = image.get("href")
+        if href is None:
+            raise UnsupportedDita("image without href")
+        alt = image.find("alt")
+        alt_text = "".join(alt.itertext()) if alt is not None else image.get("alt")
+        attrs = f' class="image" src="{escape(href, True)}"'
+        for name in ("width", "height"):
+            if image.get(name):
+                attrs += f' {name}="{escape(image.get(name), True)}"'
+        if alt_text is not None:
+            attrs += f' alt="{escape(alt_text, True)}"'
+        if image.get("placement") == "break":
+            self.out.append(f'<div class="imageleft"><img{attrs}></div>\n')
+        else:
+            self.out.append(f"<img{attrs}>")
+
+    def _caption(self, title: Optional[ElementTree.Element]):
+        if title is None:
+            return
+        self.tables += 1
+        self.out.append(f'<caption><span class="table--title-label">Table {self.tables}. </span><span class="title">')
+        self._children(title)
+        self.out.append("</span></caption>")
+
+    def _table(self, table: ElementTree.Element):
+        groups = table.findall("tgroup")
+        if len(groups) != 1:
+            raise UnsupportedDita("table without exactly one tgroup")
+        for child in table:
+            if child.tag not in ("title", "tgroup"):
+                raise UnsupportedDita(f"unsupported element <{child.tag}> in <table>")
+        self.out.append(f'<table class="table frame-all"{self._id(table, self.topic_id)}>')
+        self._caption(table.find("title"))
+        for part in groups[0]:
+            if part.tag == "colspec":
+                continue
+            if part.tag not in ("thead", "tbody"):
+                raise UnsupportedDita(f"unsupported element <{part.tag}> in <tgroup>")
+            cell = "th" if part.tag == "thead" else "td"
+            self.out.append(f'<{part.tag} class="{part.tag}">')
+            for row in part:
+                if row.tag != "row":
+                    raise UnsupportedDita(f"unsupported element <{row.tag}> in <{part.tag}>")
+                self.out.append('<tr class="row">')
+                for entry in row:
+                    if entry.tag != "entry":
+                        raise UnsupportedDita(f"unsupported element <{entry.tag}> in <row>")
+                    if any(entry.get(attr) for attr in ("namest", "nameend", "spanname", "morerows")):
+                        raise UnsupportedDita("table cell spanning columns or rows")
+                    self._check(entry)
+                    self.out.append(f'<{cell} class="entry">')
+                    self._children(entry)
+                    self.out.append(f"</{cell}>")
+                self.out.append("</tr>")
+            self.out.append(f"</{part.tag}>")
+        self.out.append("</table>\n")
+
+    def _simpletable(self, table: ElementTree.Element):
+        self.out.append(f'<table class="simpletable frame-all"{self._id(table, self.topic_id)}>')
+        self._caption(table.find("title"))
+        rows = [row for row in table if row.tag != "title"]
+        head = [row for row in rows if row.tag == "sthead"]
+        body = [row for row in rows if row.tag == "strow"]
+        if len(head) + len(body) != len(rows) or len(head) > 1:
+            raise UnsupportedDita("unsupported rows in <simpletable>")
+        for part, part_rows, cell in (("thead", head, "th"), ("tbody", body, "td")):
+            if not part_rows:
+                continue
+            self.out.append(f"<{part}>")
+            for row in part_rows:
+                self.out.append(f'<tr class="{row.tag}">')
+                for entry in row:
+                    if entry.tag != "stentry":
+                        raise UnsupportedDita(f"unsupported element <{entry.tag}> in <{row.tag}>")
+                    self._check(entry)
+                    self.out.append(f'<{cell} class="stentry">')
+                    self._children(entry)
+                    self.out.append(f"</{cell}>")
+                self.out.append("</tr>")
+            self.out.append(f"</{part}>")
+        self.out.append("</table>\n")
+
+
+def render_html(dita_file: Path) -> str:
+    """Render a DITA topic to HTML5, raising UnsupportedDita for topics that need DITA-OT."""
+    try:
+        root = ElementTree.parse(dita_file).getroot()
+    except ElementTree.ParseError as e:
+        raise UnsupportedDita("XML parse error") from e
+    try:
+        return HtmlRenderer().render(root)
+    except RecursionError:
+        raise UnsupportedDita("nested too deeply")
+
+
+STAGES = ["simplify_html", "html_to_messy", "convert_to_messy"]
+
+
+def dita_ot_html(dita_file: Path, work_dir: Path) -> Path:
+    """Render a DITA topic with DITA-OT's html5 transtype and return the HTML file."""
+    from automarkup_training_toolkit import tools
+
+    output_dir = work_dir / "dita-ot"
+    tools.run(["dita", f"--input={Path(dita_file).resolve()}", f"--output={output_dir}", "--format=html5"])
+    matching = sorted(output_dir.glob(f"**/{Path(dita_file).stem}.html"))
+    if not matching:
+        raise FileNotFoundError(f"No HTML for {dita_file} in {output_dir}")
+    return matching[0]
+
+
+def compare_with_dita_ot(dita_file: Path, work_dir: Path) -> List[str]:
+    """Return the stages whose outputs differ between the native and the DITA-OT HTML of a topic.
+
+    Raises UnsupportedDita for topics the pipeline would leave to DITA-OT anyway."""
+    from automarkup_training_toolkit.parsers import render_all
+
+    native = work_dir / "native" / "topic.html"
+    native.parent.mkdir(parents=True)
+    native.write_text(render_html(dita_file))
+    outputs = []
+    for route, html in (("native", native), ("dita-ot", dita_ot_html(dita_file, work_dir))):
+        (work_dir / route / "stages").mkdir(parents=True)
+        outputs.append(render_all(html, work_dir / route / "stages"))
+    return [stage for stage, a, b in zip(STAGES, *outputs) if a != b]
+
+
+def compare_renderers(directory: Path) -> int:
+    """Compare the native and DITA-OT routes for every topic under directory, returning how many differ."""
+    differing = compared = fallbacks = 0
+    for dita_file in sorted(Path(directory).rglob("*.dita")):
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                changed = compare_with_dita_ot(dita_file, Path(tmp))
+            except UnsupportedDita:
+                fallbacks += 1
+                continue
+        compared += 1
+        if changed:
+            differing += 1
+            print(f"{dita_file}: {', '.join(changed)} differ")
+    print(f"{compared} topic(s) compared, {fallbacks} left to DITA-OT")
+    return differing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a DITA topic to HTML5 without DITA-OT.")
+    parser.add_argument("dita_file", type=Path, help="DITA topic, or a directory of them with --compare")
+    parser.add_argument("--compare", action="store_true",
+                        help="Check that native and DITA-OT HTML give the same outputs for every topic in a directory")
+    args = parser.parse_args()
+    if args.compare:
+        differing = compare_renderers(args.dita_file)
+        print(f"{differing} topic(s) differ")
+        sys.exit(1 if differing else 0)
+    try:
+        print(render_html(args.dita_file))
+    except UnsupportedDita as e:
+        cause = f" ({e.__cause__})" if e.__cause__ else ""
+        print(f"{args.dita_file}: needs DITA-OT: {e}{cause}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
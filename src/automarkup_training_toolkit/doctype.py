@@ -0,0 +1,93 @@
+import json
+import os
+from pathlib import Path
+import re
+from typing import Dict, List, Optional, Union
+
+DOCTYPE_NAME = re.compile(rb'<!DOCTYPE\s+([^\s\[>]+)')
+NAME_START = re.compile(rb'<[A-Za-z_:]')
+
+
+def sniff_doctype(path: Path, chunk_size: int=4096, limit: int=1 << 20) -> Optional[str]:
+    """Return the DOCTYPE name of an XML file, or None if it has none.
+
+    Only the prolog is read: scanning stops at the DOCTYPE declaration or at the start of the
+    root element, whichever comes first, skipping over the XML declaration, processing
+    instructions and comments on the way.
+    """
+    buffer = b''
+    pos = 0
+    with open(path, 'rb') as f:
+        while len(buffer) < limit:
+            chunk = f.read(chunk_size)
+            buffer += chunk
+            while True:
+                start = buffer.find(b'<', pos)
+                if start < 0:
+                    pos = len(buffer)
+                    break
+                if buffer.startswith(b'<?', start):
+                    end = buffer.find(b'?>', start)
+                    if end < 0:
+                        break
+                    pos = end + 2
+                elif buffer.startswith(b'<!--', start):
+                    end = buffer.find(b'-->', start)
+                    if end < 0:
+                        break
+                    pos = end + 3
+                elif buffer.startswith(b'<!DOCTYPE', start):
+                    match = DOCTYPE_NAME.match(buffer, start)
+                    if not match or match.end() == len(buffer):  # the name may continue in the next chunk
+                        break
+                    return match.group(1).decode('latin-1')
+                elif NAME_START.match(buffer, start):
+                    return None
+                elif len(buffer) - start < len(b'<!DOCTYPE'):
+                    break
+                else:
+                    pos = start + 1
+            if not chunk:
+                return None
+    return None
+
+
+class DoctypeIndex:
+    """A persistent map from file to DOCTYPE name, so repeated runs do not reopen unchanged files.
+
+    Entries are keyed on the resolved path and are reused while the file's mtime and size match.
+    """
+
+    def __init__(self, index_file: Path):
+        self.index_file = Path(index_file)
+        self.entries: Dict[str, List[Union[int, Optional[str]]]] = {}
+        self.dirty = False
+        if self.index_file.exists():
+            try:
+                self.entries = json.loads(self.index_file.read_text())
+            except ValueError:
+                print(f'Ignoring unreadable doctype index {self.index_file}')
+
+    def doctype(self, path: Path) -> Optional[str]:
+        key = str(Path(path).resolve())
+        stat = os.stat(key)
+        entry = self.entries.get(key)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        doctype = sniff_doctype(path)
+        self.entries[key] = [stat.st_mtime_ns, stat.st_size, doctype]
+        self.dirty = True
+        return doctype
+
+    def matches(self, path: Path, doctype: str) -> bool:
+        name = self.doctype(path)
+        return name is not None and re.match(doctype, name) is not None
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_file.with_name(self.index_file.name + '.tmp')
+        tmp.write_text(json.dumps(self.entries))
+        os.replace(tmp, self.index_file)
+        self.dirty = False
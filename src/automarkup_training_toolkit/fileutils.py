@@ -0,0 +1,31 @@
+import os
+from pathlib import Path
+import shutil
+
+# ioctl request that clones a file's extents on copy-on-write filesystems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+
+def reflink(source: Path, target: Path):
+    """Make target a copy-on-write clone of source, raising OSError where that is not supported."""
+    try:
+        import fcntl
+    except ImportError:  # not on Windows
+        raise OSError("reflinks need fcntl") from None
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def clone_or_copy(source: Path, target: Path):
+    """Place a copy of source at target as cheaply as the filesystem allows.
+
+    A reflink is tried first, then shutil.copyfile, which copies in the kernel with sendfile on
+    Linux. Unlike a hardlink, either way target keeps its contents when source is later rewritten
+    in place. target is replaced atomically.
+    """
+    tmp = target.with_name(f".{target.name}.tmp")
+    try:
+        reflink(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
@@ -13,6 +13,84 @@ from bs4 import BeautifulSoup, Doctype, element
 
 from html2markdown import (_escapeCharacters, _supportedAttrs, _breakRemNewlines, _recursivelyValid, unicode)
 
+from automarkup_training_toolkit import parsers
+
+# Steps of the _messy_markdownify walk
+_VISIT = 0
+_FINISH = 1
+
+# Placeholders left in the tree for convert_to_messy to resolve once the soup is serialised.
+# They are Unicode noncharacters, which are removed from the input, so a document's own text
+# can never be mistaken for one.
+_LINK_OPEN = '\ufdd0'
+_BLOCKQUOTE_OPEN = '\ufdd1'
+_CLOSE = '\ufdd2'
+_PLACEHOLDER = re.compile('[\ufdd0\ufdd1\ufdd2]')
+_PLACEHOLDER_SPLIT = re.compile('([\ufdd0\ufdd1\ufdd2])').split
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def _resolve_placeholders(text):
+	"""Write out non-breaking spaces, collapse runs of blank lines and resolve the link and
+	blockquote placeholders of a serialised document.
+
+	Placeholders nest, so a blockquote inside a blockquote or a link inside a blockquote comes
+	out right, and the text between them is never searched again."""
+	text = _BLANK_LINES.sub('\n\n', text.replace('\xa0', '&nbsp;'))
+	if _CLOSE not in text:
+		return text
+	pieces = _PLACEHOLDER_SPLIT(text)
+	parts = [pieces[0]]
+	stack = []
+	for i in range(1, len(pieces), 2):
+		token = pieces[i]
+		if token == _CLOSE:
+			if stack:
+				content = ''.join(parts)
+				opener, parts = stack.pop()
+				if opener == _LINK_OPEN:
+					parts.append('<%s>' % content)
+				else:
+					parts.append('> ' + content.replace('\n', '\n> '))
+		else:
+			stack.append((token, parts))
+			parts = []
+		parts.append(pieces[i + 1])
+	while stack:
+		opener, outer = stack.pop()
+		outer.extend(parts)
+		parts = outer
+	return ''.join(parts)
+
+
+def _merged_string(tag):
+	"""Return what BeautifulSoup(unicode(tag), 'html.parser').string would be, without the round trip.
+
+	Unwrapping a link's children leaves runs of adjacent text nodes, so tag.string is None
+	where a re-parse would see a single string. Merge those runs (dropping empty strings,
+	which serialise to nothing) and then follow .string's rules."""
+	while True:
+		items = []
+		for child in tag.contents:
+			if type(child) is element.NavigableString:
+				if not child:
+					continue
+				if items and isinstance(items[-1], list):
+					items[-1].append(child)
+					continue
+				items.append([child])
+			else:
+				items.append(child)
+		if len(items) != 1:
+			return None
+		item = items[0]
+		if isinstance(item, list):
+			return ''.join(item)
+		if isinstance(item, element.NavigableString):
+			return item
+		tag = item
+
+
 class HTMLToMarkdownConverter:
 
 	def __init__(self):
@@ -122,7 +200,7 @@ class HTMLToMarkdownConverter:
 			
 	def _process_blockquote(self, tag):
 		# Processing logic for blockquote tag
-		self._process_tag(tag, '<<<BLOCKQUOTE: ', '>>>', True)
+		self._process_tag(tag, _BLOCKQUOTE_OPEN + ' ', _CLOSE, True)
 		
 	def _process_a(self, tag):
 		# Processing logic for a tag
@@ -134,11 +212,11 @@ class HTMLToMarkdownConverter:
 			title = ''
 			if tag.has_attr('title'):
 				title = ' "%s"' % tag['title']
-			tag.string = '[%s](%s%s)' % (BeautifulSoup(unicode(tag), 'html.parser').string,
+			tag.string = '[%s](%s%s)' % (_merged_string(tag),
 										tag.get('href', ''),
 										title)
 		else:
-			tag.string = '<<<FLOATING LINK: %s>>>' % tag.string
+			tag.string = _LINK_OPEN + tag.string + _CLOSE
 		tag.unwrap()
 
 	def _process_h(self, tag):
@@ -223,57 +301,68 @@ class HTMLToMarkdownConverter:
 
   
 	def _messy_markdownify(self, tag, _listType=None, _blockQuote=False, _listIndex=1):
-		"""Recursively converts html tags into markdown"""
-		children = tag.find_all(recursive=False)
-	
-		if tag.name == '[document]':
-			for child in children:
-				self._messy_markdownify(child, _listType, _blockQuote, _listIndex)
-			return
-
-		if tag.name not in self.tag_processors or not _supportedAttrs(tag):
-			if tag.name not in self.inlineTags:
-				tag.insert_before('\n\n')
-				tag.insert_after('\n\n')
-			else:
+		"""Converts html tags into markdown.
+
+		The tree is walked with an explicit stack rather than by recursion, so deeply nested
+		documents cannot exhaust the interpreter's recursion limit. Each tag is visited, which
+		descends into the children of unsupported inline tags first, and then finished, which
+		runs its processor and descends into its children.
+		"""
+		stack = [(_VISIT, tag, None, _listType, _blockQuote, _listIndex)]
+		while stack:
+			step, tag, children, _listType, _blockQuote, _listIndex = stack.pop()
+
+			if step == _VISIT:
+				if tag.parent is None and tag.name != '[document]':
+					# Already unwrapped or replaced by the processor of an enclosing tag
+					continue
+				children = tag.find_all(recursive=False)
+
+				if tag.name == '[document]':
+					for child in reversed(children):
+						stack.append((_VISIT, child, None, _listType, _blockQuote, _listIndex))
+					continue
+
+				if tag.name not in self.tag_processors or not _supportedAttrs(tag):
+					if tag.name not in self.inlineTags:
+						tag.insert_before('\n\n')
+						tag.insert_after('\n\n')
+					else:
+						_escapeCharacters(tag)
+						stack.append((_FINISH, tag, children, _listType, _blockQuote, _listIndex))
+						for child in reversed(children):
+							stack.append((_VISIT, child, None, None, False, 1))
+						continue
+
+			if tag.name not in ('pre', 'code'):
 				_escapeCharacters(tag)
-				for child in children:
-					self._messy_markdownify(child)
-				
-		if tag.name not in ('pre', 'code'):
-			_escapeCharacters(tag)
-			_breakRemNewlines(tag)
-
-		
-		# Handle cases where we need to pass parameters into the tag processors
-		if tag.name == 'li':
-			self.tag_processors[tag.name](tag, _listType, _listIndex)
-		elif tag.name == 'p':
-			self.tag_processors[tag.name](tag, _blockQuote)
-		elif tag.name in self.tag_processors:
-			# run the processors and pass through any arguments
-			self.tag_processors[tag.name](tag)
-
-		if tag.name in {'ol', 'ul'}:
-			_listType = tag.name
-		
-		# handle ordered lists slightly, do an early return
-		if tag.name in {'ol'}:
-			i = 0 
-			for child in children:
-				self._messy_markdownify(child, 'ol', _blockQuote, i+1)
-				i = i+1
-			
-			return 
-		
-		for child in children:
-			self._messy_markdownify(child, _listType, _blockQuote, _listIndex)
+				_breakRemNewlines(tag)
+
+			# Handle cases where we need to pass parameters into the tag processors
+			if tag.name == 'li':
+				self.tag_processors[tag.name](tag, _listType, _listIndex)
+			elif tag.name == 'p':
+				self.tag_processors[tag.name](tag, _blockQuote)
+			elif tag.name in self.tag_processors:
+				# run the processors and pass through any arguments
+				self.tag_processors[tag.name](tag)
+
+			if tag.name in {'ol', 'ul'}:
+				_listType = tag.name
+
+			# ordered lists number their items
+			if tag.name == 'ol':
+				for i in reversed(range(len(children))):
+					stack.append((_VISIT, children[i], None, 'ol', _blockQuote, i+1))
+			else:
+				for child in reversed(children):
+					stack.append((_VISIT, child, None, _listType, _blockQuote, _listIndex))
 
 	
 	def convert_to_messy(self, html):
 		"""converts an html string to markdown while preserving unsupported markup."""
 		# borrows heavily from the html2markdown library
-		soup = BeautifulSoup(html, 'html.parser')
+		soup = parsers.make_soup(_PLACEHOLDER.sub('', html))
 		
 		# Strip out doctype 
 		# TO-DO: do it at the start
@@ -286,18 +375,7 @@ class HTMLToMarkdownConverter:
 	   
 		self._messy_markdownify(soup)
 
-		# Brought in from parent module (?)
-		ret = unicode(soup).replace(u'\xa0', '&nbsp;')
-		ret = re.sub(r'\n{3,}', r'\n\n', ret)
-		# ! FIXME: hack
-		ret = re.sub(r'&lt;&lt;&lt;FLOATING LINK: (.+)&gt;&gt;&gt;', r'<\1>', ret)
-		# ! FIXME: hack
-		sp = re.split(r'(&lt;&lt;&lt;BLOCKQUOTE: .*?&gt;&gt;&gt;)', ret, flags=re.DOTALL)
-		for i,e in enumerate(sp):
-			if e[:len('&lt;&lt;&lt;BLOCKQUOTE:')] == '&lt;&lt;&lt;BLOCKQUOTE:':
-				sp[i] = '> ' + e[len('&lt;&lt;&lt;BLOCKQUOTE:') : -len('&gt;&gt;&gt;')]
-				sp[i] = sp[i].replace('\n', '\n> ')
-		ret = ''.join(sp)
+		ret = _resolve_placeholders(unicode(soup))
 		return ret.strip('\n')
 
 
@@ -1,151 +1,150 @@
 import argparse
+import hashlib
 from pathlib import Path
 import os
 import shutil
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Sequence
 from markdownify import MarkdownConverter, ATX, ATX_CLOSED, SETEXT, UNDERLINED, chomp, line_beginning_re, abstract_inline_conversion
 import random
+from automarkup_training_toolkit import parsers
 
 MARKDOWN_BQ_STYLE = "MARKDOWN_BQ_STYLE"
 
+# Every style MessyMarkdownConverter can pick from, in the order they are sampled.
+# Keeping the order keeps the outputs for a given seed unchanged.
+STYLE_TABLE = (
+    ("bullets", ('*', '+', '-', '--', '**', '++', '-*', '+*', '*-', '**-', '++-')),
+    ("default_title", (True, False)),
+    ("escape_asterisks", (True, False)),
+    ("escape_underscores", (True, False)),
+    ("heading_style", (ATX, ATX_CLOSED, 'SETEXT', 'UNDERLINED')),
+    ("strong_em_symbol", ('*', '_EM_', "~B~", "_B_", "<B>")),
+    ("wrap_width", range(40, 121)),
+    ("sub_symbol", ('~', '_', '*SUB*', '?SUB?', '!SUB!')),
+    ("sup_symbol", ('^', '^_', '*SUP*', '?SUP?', '!SUP!')),
+    ("capitalize_bold", (True, False)),
+    ("blockquote_style", ('>', '>>', '>>>', '>>>>', '>>>>>') + (MARKDOWN_BQ_STYLE,) * 5),
+    ("a_style", (
+        '%s[%s](%s%s)%s',
+        '%s%s\n<%s%s>\n%s',
+        'link_text: %s%s\nlink: <%s%s>\nlink_suffix: %s',
+        '%s%s\n<@%s%s@>\n%s',
+        '%s$%s$[%s%s]%s'
+    )),
+    ("code_style", ('`', '`%', '`>', '~+', '`~')),
+    ("pre_style", (
+        '\n```%s\n%s\n```\n',
+        '\n~~~%s\n%s\n~~~\n',
+        '\n^^^%s\n%s\n^^^\n',
+        '\n+++%s\n%s\n+++\n',
+        '\n!?!%s\n%s\n!?!\n'
+    )),
+    ("img_style", ('![%s](%s%s)', '@[%s]!@(%s%s)', '<[%s]>!(%s%s)', '[%s]!!(%s%s)', '?[%s](%s%s)')),
+    ("p_style", ('%s\n\n\t', '%s\n\n\t\t', '%s\n\n  ', '%s\n\t', '%s\n  ')),
+    ("h_style", ("#", "#@", "@#", "#!", "!#")),
+    ("h_style_under", ("=", '-', "&", "&=", "&-")),
+    ("li_style", ('%s.', '%s... ', '%s. ', '%s ', '%s...')),
+    ("table_style_f", ('\n\n', '\n\n\n', '\n\t\t', '\n\n\t', '\n\n  ')),
+    ("table_style_r", ('\n', '\n\n', '\n\t')),
+    ("td_style_f", (' ', '  ', '_ ')),
+    ("td_style_r", ('|', ':', '|:', ':|')),
+    ("title_style", ('_TITLE_', '_TT_', '!!!', '<T>', '')),
+    ("var_style", ("$", "$$", "$!", "!$", "$ $")),
+    ("caption_style", ("%s", "[%s]\n", "%s\n", "\nCAPTION: %s\n", "\nCAPTION: [%s]\n")),
+    ("dd_style", (":%s\n", "::%s\n", "\n:%s\n", "\n::%s\n")),
+    ("dt_style", ("%s\n:", "%s\n::", "\n%s\n:", "\n%s\n::")),
+)
+# Styles that are markdownify options; the rest are attributes of MessyMarkdownConverter.
+OPTION_STYLES = frozenset(["bullets", "default_title", "escape_asterisks", "escape_underscores", "heading_style",
+                           "strong_em_symbol", "wrap_width", "sub_symbol", "sup_symbol"])
+STYLE_NAMES = tuple(name for name, _ in STYLE_TABLE)
+
+
+def stable_seed(*parts) -> int:
+    """A seed derived from parts that is the same in every process, unlike hash() of a string."""
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def settings() -> dict:
+    """Everything besides the input and seed that determines html_to_messy's output."""
+    return {"styles": STYLE_TABLE, "html_parser": parsers.html_parser}
+
+
+class StyleProfile:
+    """One choice from each entry of STYLE_TABLE, stored as indexes into the table.
+
+    Profiles are immutable, hashable and can be round-tripped through to_dict/from_dict,
+    so a set of variant configurations can be generated once and reused.
+    """
+
+    __slots__ = ("indexes",)
+
+    def __init__(self, indexes: Sequence[int]):
+        if len(indexes) != len(STYLE_TABLE):
+            raise ValueError(f"Expected {len(STYLE_TABLE)} style indexes, got {len(indexes)}")
+        # Point repeated choices (like MARKDOWN_BQ_STYLE) at their first occurrence so equal profiles compare equal
+        indexes = tuple(choices.index(choices[index]) for (_, choices), index in zip(STYLE_TABLE, indexes))
+        object.__setattr__(self, "indexes", indexes)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StyleProfile is immutable")
+
+    def __eq__(self, other):
+        return isinstance(other, StyleProfile) and self.indexes == other.indexes
+
+    def __hash__(self):
+        return hash(self.indexes)
+
+    def __reduce__(self):
+        return (StyleProfile, (self.indexes,))
+
+    def __repr__(self):
+        return f"StyleProfile({self.indexes!r})"
+
+    @classmethod
+    def from_seed(cls, seed) -> "StyleProfile":
+        # randrange(n) makes the same draw as random.choice on a sequence of length n
+        rng = random.Random(seed)
+        return cls([rng.randrange(len(choices)) for _, choices in STYLE_TABLE])
+
+    @classmethod
+    def many(cls, seeds: Iterable) -> List["StyleProfile"]:
+        return [cls.from_seed(seed) for seed in seeds]
+
+    def values(self) -> Dict[str, object]:
+        return {name: choices[index] for (name, choices), index in zip(STYLE_TABLE, self.indexes)}
+
+    def to_dict(self) -> Dict[str, object]:
+        return self.values()
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, object]) -> "StyleProfile":
+        return cls([list(choices).index(values[name]) for name, choices in STYLE_TABLE])
+
+
 class MessyMarkdownConverter(MarkdownConverter):
     """
     Create a custom MarkdownConverter that adds two newlines after an image
     """
-    counter = 0
-    def __init__(self, **options):
-        self.__class__.counter += 1
-        self.seed  = options.get("seed", self.__class__.counter)
-        self.random = random.Random(self.seed)
+    def __init__(self, profile: Optional[StyleProfile] = None, **options):
+        self.seed = options.get("seed", 0)
+        self.profile = profile or StyleProfile.from_seed(self.seed)
+        styles = self.profile.values()
 
-        #  options.setdefault("autolinks", self.random.choice([True, False]))
+        #  options.setdefault("autolinks", <random choice of True, False>)
         options.setdefault("autolinks", False)
-        options.setdefault("bullets", self.random.choice(['*', '+', '-', '--', '**', '++', '-*', '+*', '*-', '**-', '++-']))
-        options.setdefault("default_title", self.random.choice([True, False]))
-        options.setdefault("escape_asterisks", self.random.choice([True, False]))
-        options.setdefault("escape_underscores", self.random.choice([True, False]))
-        options.setdefault("heading_style", self.random.choice([ATX, ATX_CLOSED, 'SETEXT', 'UNDERLINED']))
-        options.setdefault("strong_em_symbol", self.random.choice(['*', '_EM_', "~B~", "_B_", "<B>"]))
-        options.setdefault("wrap_width", self.random.randint(40, 120))
-        options.setdefault("sub_symbol", self.random.choice(['~', '_', '*SUB*', '?SUB?', '!SUB!']))
-        options.setdefault("sup_symbol", self.random.choice(['^', '^_', '*SUP*', '?SUP?', '!SUP!']))
-        self.capitalize_bold = self.random.choice([True, False])
-        self.blockquote_style = self.random.choice(['>', '>>', '>>>', '>>>>', '>>>>>'] + [MARKDOWN_BQ_STYLE] * 5)
-        self.a_style = self.random.choice([
-            '%s[%s](%s%s)%s',
-            '%s%s\n<%s%s>\n%s',
-            'link_text: %s%s\nlink: <%s%s>\nlink_suffix: %s',
-            '%s%s\n<@%s%s@>\n%s',
-            '%s$%s$[%s%s]%s'
-        ])
-        self.code_style = self.random.choice([
-            '`',
-            '`%',
-            '`>',
-            '~+',
-            '`~'
-        ])
-        self.pre_style = self.random.choice([
-            '\n```%s\n%s\n```\n',
-            '\n~~~%s\n%s\n~~~\n',
-            '\n^^^%s\n%s\n^^^\n',
-            '\n+++%s\n%s\n+++\n',
-            '\n!?!%s\n%s\n!?!\n'
-        ])
-        self.img_style = self.random.choice([
-            '![%s](%s%s)',
-            '@[%s]!@(%s%s)',
-            '<[%s]>!(%s%s)',
-            '[%s]!!(%s%s)',
-            '?[%s](%s%s)'
-        ])
-        self.p_style = self.random.choice([
-            '%s\n\n\t',
-            '%s\n\n\t\t',
-            '%s\n\n  ',
-            '%s\n\t',
-            '%s\n  '
-        ])
-        self.h_style = self.random.choice([
-            "#",
-            "#@",
-            "@#",
-            "#!",
-            "!#"
-        ])
-        self.h_style_under = self.random.choice([
-            "=",
-            '-',
-            "&",
-            "&=",
-            "&-"
-        ])
-        self.li_style = self.random.choice([
-            '%s.',
-            '%s... ',
-            '%s. ',
-            '%s ',
-            '%s...'
-        ])
-        self.table_style_f = self.random.choice([
-            '\n\n',
-            '\n\n\n',
-            '\n\t\t',
-            '\n\n\t',
-            '\n\n  '
-        ])
-        self.table_style_r = self.random.choice([
-            '\n',
-            '\n\n',
-            '\n\t',
-        ])
-        self.td_style_f = self.random.choice([
-            ' ',
-            '  ',
-            '_ '
-        ])
-        self.td_style_r = self.random.choice([
-            '|',
-            ':',
-            '|:',
-            ':|'
-        ])
-        self.title_style = self.random.choice([
-            '_TITLE_',
-            '_TT_',
-            '!!!',
-            '<T>',
-            ''
-        ])
-        self.var_style = self.random.choice([
-            "$",
-            "$$",
-            "$!",
-            "!$",
-            "$ $"
-        ])
-        self.caption_style = self.random.choice([
-            "%s",
-            "[%s]\n",
-            "%s\n",
-            "\nCAPTION: %s\n",
-            "\nCAPTION: [%s]\n"
-        ])
-        self.dd_style = self.random.choice([
-            ":%s\n",
-            "::%s\n",
-            "\n:%s\n",
-            "\n::%s\n"
-        ])
-        self.dt_style = self.random.choice([
-            "%s\n:",
-            "%s\n::",
-            "\n%s\n:",
-            "\n%s\n::"
-        ])
+        for name, value in styles.items():
+            if name in OPTION_STYLES:
+                options.setdefault(name, value)
+            else:
+                setattr(self, name, value)
         # print("Random seed set to {}".format(self.seed))
         super().__init__(**options)
 
+    def convert(self, html):
+        return self.convert_soup(parsers.make_soup(html))
+
     #TODO: Why are we eliminating the title node?
     # def process_tag(self, node, *args, **kwargs):
     #     if node.name == "title":
@@ -287,7 +286,7 @@ def process_file(file_path: Path, out_dir: Optional[Path] = None, options: Optio
     clean_file = file_path.with_suffix(".clean")
     clean_converter = MarkdownConverter()
     input = file_path.read_text()
-    clean = clean_converter.convert(input).strip()
+    clean = clean_converter.convert_soup(parsers.make_soup(input)).strip()
     clean_file.write_text(clean)
     html_to_messy(file_path, messy_file, options)
     if out_dir:
@@ -300,12 +299,29 @@ def process_file(file_path: Path, out_dir: Optional[Path] = None, options: Optio
 def html_to_messy(file_path: Path, messy_file: Path, options: Optional[dict] = None) -> None:
     input = file_path.read_text()
     options = options or {}
-    options["seed"] = options.get("seed", hash(input))
+    options["seed"] = options.get("seed", stable_seed(input))
     converter = MessyMarkdownConverter(**options)
     messy = converter.convert(input).strip()
     messy_file.write_text(messy)
     # print(f"Created: {messy_file, clean_file}")
 
+def html_to_messy_many(file_path: Path, seeds: Iterable[int], options: Optional[dict] = None) -> List[str]:
+    """Render one messy variant per seed from a single parse of file_path."""
+    return render_messy(file_path.read_text(), seeds, options)
+
+def render_messy(html: str, seeds: Iterable[int], options: Optional[dict] = None) -> List[str]:
+    """Render one messy variant of an HTML string per seed from a single parse.
+
+    The converters only make idempotent changes to the tree (dropping whitespace-only
+    text nodes between list and table elements, emptying <title>), so every variant
+    matches what html_to_messy produces from a fresh parse.
+    """
+    soup = parsers.make_soup(html)
+    options = options or {}
+    seeds = list(seeds)
+    return [MessyMarkdownConverter(profile, **dict(options, seed=seed)).convert_soup(soup).strip()
+            for seed, profile in zip(seeds, StyleProfile.many(seeds))]
+
 def process_html_files(directory: Path, out_dir: Optional[Path] = None, options: Optional[dict] = None) -> None:
     for file_path in directory.rglob('*.html'):
         process_file(file_path, out_dir, options)
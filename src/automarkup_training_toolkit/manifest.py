@@ -0,0 +1,49 @@
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Dict, Optional
+
+MANIFEST_NAME = "build_manifest.json"
+
+
+class BuildManifest:
+    """Records what each output of a topic was built from, so later runs only rebuild what changed.
+
+    Outputs are keyed by their path relative to the manifest's directory and map to the
+    fingerprint of the input and converter settings they were built with (see
+    Converter.fingerprint). An output with no entry, or a different fingerprint, is rebuilt.
+    """
+
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = Path(manifest_file)
+        self.entries: Dict[str, str] = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+        if self.manifest_file.exists():
+            try:
+                self.entries = json.loads(self.manifest_file.read_text())
+            except ValueError:
+                print(f'Ignoring unreadable build manifest {self.manifest_file}')
+
+    def _name(self, output_file: Path) -> str:
+        return os.path.relpath(output_file, self.manifest_file.parent)
+
+    def get(self, output_file: Path) -> Optional[str]:
+        with self._lock:
+            return self.entries.get(self._name(output_file))
+
+    def record(self, output_file: Path, fingerprint: str):
+        with self._lock:
+            self.entries[self._name(output_file)] = fingerprint
+            self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.manifest_file.with_name(self.manifest_file.name + '.tmp')
+            tmp.write_text(json.dumps(self.entries, indent=1, sort_keys=True))
+            os.replace(tmp, self.manifest_file)
+            self.dirty = False
@@ -0,0 +1,131 @@
+"""Per-stage timing and throughput records for the conversion pipeline.
+
+Every stage the scheduler runs (and every DITA-OT batch) produces one record:
+
+    {"topic": "topic1", "stage": "PandocConverter", "start": 1700000000.0, "wall": 0.41, "cpu": 0.002,
+     "bytes_in": 5120, "bytes_out": 9310, "converted": 4, "cached": 0, "skipped": 0, "ok": true,
+     "pid": 4242, "thread": 139872}
+
+cpu is the CPU time of the thread that ran the stage, so for the DITA-OT and Pandoc stages,
+which wait on a subprocess, it is close to zero and wall is the cost. Records can be written as
+JSON lines and as a Chrome trace (load it in chrome://tracing or https://ui.perfetto.dev).
+"""
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+OUTCOMES = ("converted", "cached", "skipped")
+
+
+class StageRecorder:
+    """Collects stage records in this process until they are taken."""
+
+    def __init__(self):
+        self.records: List[dict] = []
+        self._lock = threading.Lock()
+
+    def measure(self, topic: Optional[str], stage: str, converters: list, run: Callable[[], None]):
+        """Run a stage, recording its cost whether or not it succeeds."""
+        start = time.time()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        ok = False
+        try:
+            run()
+            ok = True
+        finally:
+            record = {
+                "topic": topic,
+                "stage": stage,
+                "start": start,
+                "wall": time.perf_counter() - wall,
+                "cpu": time.thread_time() - cpu,
+                "bytes_in": _total_size({converter.input_file for converter in converters
+                                         if getattr(converter, "input_file", None) is not None}),
+                "bytes_out": _total_size({converter.output_file for converter in converters}),
+                **{outcome: sum(converter.outcome == outcome for converter in converters) for outcome in OUTCOMES},
+                "ok": ok,
+                "pid": os.getpid(),
+                "thread": threading.get_ident(),
+            }
+            with self._lock:
+                self.records.append(record)
+
+    def take(self) -> List[dict]:
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+
+def _total_size(paths) -> int:
+    size = 0
+    for path in paths:
+        try:
+            size += os.stat(path).st_size
+        except OSError:
+            pass
+    return size
+
+
+# The recorder the scheduler reports to; set up by the command line, None records nothing.
+recorder: Optional[StageRecorder] = None
+
+
+def measure(topic: Optional[str], stage: str, converters: list, run: Callable[[], None]):
+    if recorder is None:
+        run()
+    else:
+        recorder.measure(topic, stage, converters, run)
+
+
+def take_records() -> List[dict]:
+    return recorder.take() if recorder is not None else []
+
+
+def write_jsonl(path: Path, records: List[dict]):
+    with open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def write_trace(path: Path, records: List[dict]):
+    """Write records as Chrome trace events, one complete ("X") event per stage."""
+    events = [{
+        "name": record["stage"],
+        "cat": "stage",
+        "ph": "X",
+        "ts": int(record["start"] * 1e6),
+        "dur": int(record["wall"] * 1e6),
+        "pid": record["pid"],
+        "tid": record["thread"],
+        "args": {key: record[key] for key in ("topic", "cpu", "bytes_in", "bytes_out", *OUTCOMES, "ok")},
+    } for record in records]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def summarize(records: List[dict]) -> Dict[str, Dict[str, float]]:
+    totals: Dict[str, Dict[str, float]] = {}
+    for record in records:
+        total = totals.setdefault(record["stage"], dict.fromkeys(("runs", "wall", "cpu", "bytes_in", "bytes_out", *OUTCOMES, "failed"), 0))
+        total["runs"] += 1
+        total["failed"] += not record["ok"]
+        for key in ("wall", "cpu", "bytes_in", "bytes_out", *OUTCOMES):
+            total[key] += record[key]
+    return totals
+
+
+def print_summary(records: List[dict]):
+    """Print the cost of each stage across all topics, most expensive first."""
+    totals = summarize(records)
+    if not totals:
+        return
+    all_wall = sum(total["wall"] for total in totals.values()) or 1.0
+    print(f"{'Stage':32} {'runs':>5} {'conv':>5} {'cache':>5} {'skip':>5} {'fail':>5} {'wall s':>9} {'share':>6} {'cpu s':>8} {'MB in':>8} {'MB out':>8}")
+    for stage, total in sorted(totals.items(), key=lambda item: -item[1]["wall"]):
+        print(f"{stage:32} {total['runs']:5d} {total['converted']:5d} {total['cached']:5d} {total['skipped']:5d} "
+              f"{total['failed']:5d} {total['wall']:9.2f} {total['wall'] / all_wall:6.1%} {total['cpu']:8.2f} "
+              f"{total['bytes_in'] / 1e6:8.2f} {total['bytes_out'] / 1e6:8.2f}")
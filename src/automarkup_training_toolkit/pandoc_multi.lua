@@ -0,0 +1,50 @@
+-- Render many HTML documents to many formats in one pandoc process.
+--
+-- Each input is read and parsed once; every requested format is written
+-- from that single parse. The work list is a tab-separated manifest named
+-- by the "manifest" metadata field, one document per line:
+--
+--   input.html<TAB>rst<TAB>out.rst<TAB>plain<TAB>out.plain ...
+--
+-- Documents that fail are reported on stderr and skipped so that the rest
+-- of the batch still gets written. Each output is written to a temporary
+-- file and renamed, so an output exists only once it is complete.
+
+local function split(line)
+  local fields = {}
+  for field in string.gmatch(line, '[^\t]+') do
+    table.insert(fields, field)
+  end
+  return fields
+end
+
+local function render(fields)
+  local f = assert(io.open(fields[1], 'r'))
+  local html = f:read('a')
+  f:close()
+  local parsed = pandoc.read(html, 'html')
+  for i = 2, #fields, 2 do
+    local text = pandoc.write(parsed, fields[i])
+    -- Like the pandoc command line, end non-standalone output with a newline.
+    if text:sub(-1) ~= '\n' then
+      text = text .. '\n'
+    end
+    local tmp = fields[i + 1] .. '.tmp'
+    local out = assert(io.open(tmp, 'w'))
+    out:write(text)
+    out:close()
+    assert(os.rename(tmp, fields[i + 1]))
+  end
+end
+
+function Pandoc(doc)
+  local manifest = pandoc.utils.stringify(doc.meta.manifest)
+  for line in io.lines(manifest) do
+    local fields = split(line)
+    local ok, err = pcall(render, fields)
+    if not ok then
+      io.stderr:write('pandoc_multi: ' .. fields[1] .. ': ' .. tostring(err) .. '\n')
+    end
+  end
+  return doc
+end
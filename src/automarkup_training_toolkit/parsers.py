@@ -0,0 +1,97 @@
+"""The HTML parser used for whole documents by simplify_html, html_to_messy and html2markdown.
+
+BeautifulSoup's pure-Python "html.parser" is the default. "lxml" is much faster on large
+DITA-generated HTML; run this module on a corpus to check that a parser gives the same results
+before switching to it:
+
+    python -m automarkup_training_toolkit.parsers out/formats --parser lxml
+
+On DITA-OT HTML, lxml gives the same Markdown and plain-text outputs as html.parser, but the
+simplified HTML loses the newline between the doctype and <html>. html5lib adds <tbody> to
+tables, which changes the outputs. tests/test_parsers.py checks both on sample topics.
+"""
+import argparse
+from pathlib import Path
+import sys
+import tempfile
+from typing import List
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+HTML_PARSERS = ("html.parser", "lxml", "html5lib")
+
+html_parser = "html.parser"
+
+
+def set_html_parser(name: str) -> None:
+    global html_parser
+    if name not in HTML_PARSERS:
+        raise ValueError(f"Unknown HTML parser {name!r}, expected one of {HTML_PARSERS}")
+    try:
+        BeautifulSoup("", name)
+    except FeatureNotFound:
+        raise ValueError(f"HTML parser {name!r} is not installed; try `pip install {name}`") from None
+    html_parser = name
+
+
+def make_soup(markup: str) -> BeautifulSoup:
+    """Parse a whole HTML document with the configured parser."""
+    return BeautifulSoup(markup, html_parser)
+
+
+def render_all(file_path: Path, tmp_dir: Path) -> List[str]:
+    """Run every in-process stage on one file with the current parser and return their outputs."""
+    # Imported here because those modules import this one
+    from automarkup_training_toolkit import parsers
+    from automarkup_training_toolkit.html2markdown import HTMLToMarkdownConverter
+    from automarkup_training_toolkit.html_to_messy import html_to_messy
+    from automarkup_training_toolkit.simplify_html import simplify_html
+
+    simplified = tmp_dir / f"{parsers.html_parser}.html"
+    messy = tmp_dir / f"{parsers.html_parser}.messy"
+    simplify_html(file_path, simplified, verify="off")
+    html_to_messy(simplified, messy, {"seed": 1})
+    return [
+        simplified.read_text(),
+        messy.read_text(),
+        HTMLToMarkdownConverter().convert_to_messy(simplified.read_text()),
+    ]
+
+
+def compare_parsers(directory: Path, parser: str) -> int:
+    """Report files whose outputs differ between html.parser and parser, returning how many did."""
+    # The stages read the parser from the package module. Run with -m, this file is a separate
+    # __main__ module, and setting its html_parser would compare html.parser with itself.
+    from automarkup_training_toolkit import parsers
+
+    stages = ["simplify_html", "html_to_messy", "convert_to_messy"]
+    differing = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_path in sorted(directory.rglob("*.html")):
+            outputs = []
+            for name in ("html.parser", parser):
+                parsers.set_html_parser(name)
+                try:
+                    outputs.append(render_all(file_path, Path(tmp)))
+                except Exception as e:
+                    outputs.append([f"{type(e).__name__}: {e}"] * len(stages))
+            parsers.set_html_parser("html.parser")
+            changed = [stage for stage, a, b in zip(stages, *outputs) if a != b]
+            if changed:
+                differing += 1
+                print(f"{file_path}: {', '.join(changed)} differ")
+    return differing
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that an HTML parser gives the same outputs as html.parser.")
+    parser.add_argument("directory", type=Path, help="Directory to search for HTML files.")
+    parser.add_argument("--parser", choices=HTML_PARSERS, default="lxml", help="Parser to compare with html.parser.")
+    args = parser.parse_args()
+    differing = compare_parsers(args.directory, args.parser)
+    print(f"{differing} file(s) differ")
+    sys.exit(1 if differing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""The per-topic conversion graph, and a generator that runs it without an output tree.
+
+    from automarkup_training_toolkit import iter_examples
+
+    for example in iter_examples("dita/"):
+        print(example.topic, example.variant, len(example.text))
+"""
+from functools import partial
+from itertools import chain
+from pathlib import Path
+import re
+import tempfile
+import traceback
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from automarkup_training_toolkit.converters import Converter, PandocConverter, HtmlToMessYEConverter, SimplifiedDitaConverter, DitaMarkdownConverter, DitaHtmlConverter, HtmlToSimplifiedHtmlConverter, HtmlToMessyConverter, PandocRstConverter, PandocTxtConverter, PandocAsciidocConverter, PandocOrgModeConverter
+from automarkup_training_toolkit.doctype import sniff_doctype
+from automarkup_training_toolkit.html2markdown import HTMLToMarkdownConverter
+from automarkup_training_toolkit.html_to_messy import render_messy
+from automarkup_training_toolkit.manifest import MANIFEST_NAME, BuildManifest
+from automarkup_training_toolkit.scheduler import Stage, run_stages
+from automarkup_training_toolkit import tools
+
+# Number of messy Markdown variants per topic; set from --messy_variants
+MESSY_VARIANTS = 5
+
+
+class Example(NamedTuple):
+    """One plain-text variant of a topic, with the topic's markup."""
+    topic: str
+    variant: str
+    markup: str
+    html: str
+    text: str
+
+
+def matches_doctype(input_file: Path, doctype: Optional[str]=None) -> bool:
+    if not doctype:
+        return True
+    name = sniff_doctype(input_file)
+    return name is not None and re.match(doctype, name) is not None
+
+
+def build_converters(input_file: Path, input_dir: Path, output_dir: Path, messy_variants: Optional[int]=None) -> List[Converter]:
+    topic_path = input_file.relative_to(input_dir)
+    output_dir = output_dir / topic_path.stem
+    if messy_variants is None:
+        messy_variants = MESSY_VARIANTS
+
+    base_name = input_file.stem
+    transformations = {'Original': input_file}
+
+    plain_text = output_dir / "plain_text"
+    markup = output_dir / "markup"
+    tmp = output_dir / "tmp"
+
+    converters = [
+        SimplifiedDitaConverter(markup, base_name, transformations, 'Original'),
+        DitaMarkdownConverter(plain_text, base_name, transformations, SimplifiedDitaConverter.__name__),
+        DitaHtmlConverter(tmp, base_name, transformations, SimplifiedDitaConverter.__name__),
+        HtmlToSimplifiedHtmlConverter(markup, base_name, transformations, 'DitaHtmlConverter'),
+        *(HtmlToMessyConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter', seed, topic_path.as_posix())
+          for seed in range(1, messy_variants + 1)),
+        PandocRstConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
+        PandocTxtConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
+        PandocAsciidocConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
+        PandocOrgModeConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
+        HtmlToMessYEConverter(plain_text, base_name, transformations, 'HtmlToSimplifiedHtmlConverter'),
+    ]
+    manifest = BuildManifest(output_dir / MANIFEST_NAME)
+    for converter in converters:
+        converter.manifest = manifest
+    return converters
+
+
+def batch_class(converter: Converter) -> Optional[type]:
+    """The class whose convert_batch runs this converter together with its siblings, if any."""
+    if isinstance(converter, PandocConverter):
+        return PandocConverter
+    if type(converter) is HtmlToMessyConverter:
+        return HtmlToMessyConverter
+    return None
+
+
+def build_stages(converters: List[Converter]) -> List[Stage]:
+    """Turn a topic's converters into the stage graph.
+
+    The Pandoc converters share one stage and one pandoc run, and the messy variants share one
+    stage and one parse of the simplified HTML."""
+    batches: Dict[type, List[Converter]] = {}
+    for converter in converters:
+        if batch_class(converter):
+            batches.setdefault(batch_class(converter), []).append(converter)
+    stages = []
+    for converter in converters:
+        cls = batch_class(converter)
+        if cls is None:
+            stages.append(Stage([converter]))
+        elif converter is batches[cls][0]:
+            stages.append(Stage(batches[cls], partial(cls.convert_batch, batches[cls]), cls.__name__))
+    return stages
+
+
+def variant_name(output_file: Path) -> str:
+    """The variant part of a plain-text file name, e.g. "1.messy" for topic1.1.messy."""
+    return output_file.name.partition(".")[2]
+
+
+def topic_examples(input_file: Path, input_dir: Path, work_dir: Path, messy_variants: Optional[int]=None, stage_workers: int=1) -> List[Example]:
+    """Convert one topic and return its examples.
+
+    DITA-OT and pandoc work on files, so their stages run with work_dir as the output directory.
+    The messy and MessYE variants are rendered from the simplified HTML in memory instead.
+    """
+    converters = build_converters(input_file, input_dir, work_dir, messy_variants)
+    in_memory = [converter for converter in converters if isinstance(converter, HtmlToMessyConverter)]
+    on_disk = [converter for converter in converters if converter not in in_memory]
+    run_stages(build_stages(on_disk), stage_workers)
+
+    transformations = converters[0].transformations
+    topic = input_file.relative_to(input_dir).stem
+    markup = Path(transformations[SimplifiedDitaConverter.__name__]).read_text()
+    html = Path(transformations[HtmlToSimplifiedHtmlConverter.__name__]).read_text()
+    plain_text_dir = work_dir / topic / "plain_text"
+
+    texts = {}
+    for converter in on_disk:
+        if converter.output_dir == plain_text_dir:
+            texts[converter] = converter.output_file.read_text()
+    for converter in in_memory:
+        converter.resolve_input()
+    messy = [converter for converter in in_memory if type(converter) is HtmlToMessyConverter]
+    texts.update(zip(messy, render_messy(html, [converter.messy_seed() for converter in messy])))
+    for converter in in_memory:
+        if isinstance(converter, HtmlToMessYEConverter):
+            texts[converter] = HTMLToMarkdownConverter().convert_to_messy(html)
+
+    return [Example(topic, variant_name(converter.output_file), markup, html, texts[converter])
+            for converter in converters if converter in texts]
+
+
+def iter_examples(input_dir: Path, glob: str='*.xml,*.dita', doctype: Optional[str]=None,
+                  messy_variants: Optional[int]=None, stage_workers: int=1, skip_failed: bool=False,
+                  echo: bool=False) -> Iterator[Example]:
+    """Yield the examples of every topic under input_dir, one topic at a time, without writing an output tree.
+
+    Each topic's file-based intermediates live in a temporary directory that is removed before its
+    examples are yielded. A topic that fails to convert raises, or with skip_failed is reported
+    and skipped. The dita and pandoc command lines are printed only with echo.
+    """
+    input_dir = Path(input_dir)
+    for input_file in sorted(chain(*(input_dir.rglob(pat) for pat in glob.split(",")))):
+        if not matches_doctype(input_file, doctype):
+            continue
+        with tempfile.TemporaryDirectory(prefix="automarkup-") as work_dir:
+            echoed, tools.echo = tools.echo, echo
+            try:
+                examples = topic_examples(input_file, input_dir, Path(work_dir), messy_variants, stage_workers)
+            except Exception:
+                if not skip_failed:
+                    raise
+                print(f"FAILED: {input_file}\n{traceback.format_exc()}", end="")
+                continue
+            finally:
+                tools.echo = echoed
+        yield from examples
@@ -0,0 +1,133 @@
+"""CPU and memory profiles of the in-process converter steps, aggregated per converter.
+
+With --profile DIR every run of simplify_html, of the messy renderers and of the element-removal pass
+over the DITA-OT output is profiled with cProfile and tracemalloc. DIR then holds:
+
+    report.txt        per converter: documents, time, peak memory and the top functions;
+                      then the slowest documents overall
+    <Converter>.prof  the merged cProfile stats, for pstats, snakeviz and the like
+
+DITA-OT and pandoc run as subprocesses and are not profiled; the stage metrics cover them. Under
+--profile the stages of a topic run one at a time (topics still run in parallel with --jobs), so
+the timings are those of the sequential schedule, not of the overlapped one of --stage_workers.
+"""
+from contextlib import contextmanager
+import cProfile
+import heapq
+import io
+from pathlib import Path
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+REPORT_NAME = "report.txt"
+
+
+class _Snapshot:
+    """Lets pstats.Stats load the raw stats of a profile taken in another process."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """Collects profiles of in-process steps, per converter, until they are taken or reported.
+
+    cProfile and tracemalloc's peak are per process, so profiled steps run one at a time; the
+    command line runs a topic's stages in turn under --profile rather than queueing them here.
+    """
+
+    def __init__(self, slowest: int=20, top_functions: int=25):
+        self.slowest = slowest
+        self.top_functions = top_functions
+        self.stats: Dict[str, pstats.Stats] = {}
+        # converter -> [documents, seconds, sum of peaks, max peak]
+        self.totals: Dict[str, List[float]] = {}
+        # (seconds, peak bytes, converter, document), the slowest documents
+        self.documents: List[Tuple[float, int, str, str]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, converter: str, document: str):
+        with self._lock:
+            started_tracing = not tracemalloc.is_tracing()
+            if not started_tracing and not hasattr(tracemalloc, "reset_peak"):
+                # Python < 3.9 has no reset_peak; restarting tracing resets the peak instead.
+                tracemalloc.stop()
+                started_tracing = True
+            if started_tracing:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                seconds = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                if started_tracing:
+                    tracemalloc.stop()
+                self.stats.setdefault(converter, pstats.Stats()).add(profile)
+                self._add_totals(converter, 1, seconds, peak, peak)
+                self._keep_slowest((seconds, peak, converter, document))
+
+    def _add_totals(self, converter: str, count: int, seconds: float, peaks: int, max_peak: int):
+        total = self.totals.setdefault(converter, [0, 0.0, 0, 0])
+        total[0] += count
+        total[1] += seconds
+        total[2] += peaks
+        total[3] = max(total[3], max_peak)
+
+    def _keep_slowest(self, entry: Tuple[float, int, str, str]):
+        if len(self.documents) < self.slowest:
+            heapq.heappush(self.documents, entry)
+        else:
+            heapq.heappushpop(self.documents, entry)
+
+    def take(self) -> dict:
+        """Collect and reset what was profiled in this process, so pool workers can report it per task."""
+        with self._lock:
+            taken = {
+                "stats": {converter: stats.stats for converter, stats in self.stats.items()},
+                "totals": self.totals,
+                "documents": self.documents,
+            }
+            self.stats, self.totals, self.documents = {}, {}, []
+        return taken
+
+    def add(self, taken: dict):
+        """Merge what another process's profiler took."""
+        with self._lock:
+            for converter, raw in taken["stats"].items():
+                self.stats.setdefault(converter, pstats.Stats()).add(_Snapshot(raw))
+            for converter, total in taken["totals"].items():
+                self._add_totals(converter, *total)
+            for entry in taken["documents"]:
+                self._keep_slowest(tuple(entry))
+
+    def write_report(self, profile_dir: Path):
+        profile_dir = Path(profile_dir)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        report = io.StringIO()
+        for converter, (count, seconds, peaks, max_peak) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            stats = self.stats[converter]
+            stats.dump_stats(profile_dir / f"{converter}.prof")
+            print(f"== {converter}: {count} documents, {seconds:.2f} s, "
+                  f"peak memory {peaks / max(count, 1) / 1e6:.2f} MB mean, {max_peak / 1e6:.2f} MB max", file=report)
+            stats.stream = report
+            stats.sort_stats(pstats.SortKey.CUMULATIVE, pstats.SortKey.TIME).print_stats(self.top_functions)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top_functions)
+        print("== Slowest documents", file=report)
+        print(f"{'seconds':>9} {'peak MB':>8}  {'converter':32} document", file=report)
+        for seconds, peak, converter, document in sorted(self.documents, reverse=True):
+            print(f"{seconds:9.3f} {peak / 1e6:8.2f}  {converter:32} {document}", file=report)
+        (profile_dir / REPORT_NAME).write_text(report.getvalue())
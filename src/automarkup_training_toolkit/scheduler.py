@@ -0,0 +1,64 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set
+
+from automarkup_training_toolkit import metrics
+from automarkup_training_toolkit.converters import Converter
+
+
+class Stage:
+    """A node in a topic's conversion graph: one or more converters that run together.
+
+    The stage provides the transformation keys of its converters and requires the keys they
+    depend on, which is what links stages into a graph. Its name labels it in the stage metrics.
+    """
+
+    def __init__(self, converters: List[Converter], run: Optional[Callable[[], None]]=None, name: Optional[str]=None):
+        self.converters = converters
+        self.run = run or converters[0].convert
+        self.name = name or converters[0].__class__.__name__
+        self.provides = {converter.get_key() for converter in converters}
+        self.requires = {converter.dependent_key for converter in converters if converter.dependent_key} - self.provides
+
+    def __repr__(self):
+        return f"Stage({', '.join(converter.__class__.__name__ for converter in self.converters)})"
+
+
+def dependencies(stages: List[Stage]) -> Dict[Stage, Set[Stage]]:
+    """Map each stage to the stages producing its inputs. Keys nothing provides, like 'Original', are given."""
+    producers: Dict[str, List[Stage]] = {}
+    for stage in stages:
+        for key in stage.provides:
+            producers.setdefault(key, []).append(stage)
+    return {stage: {producer for key in stage.requires for producer in producers.get(key, [])} for stage in stages}
+
+
+def run_stages(stages: List[Stage], max_workers: int=1):
+    """Run stages on a thread pool, starting each one as soon as the stages it depends on are done.
+
+    Ready stages start in list order, so with one worker this is the plain sequential pipeline.
+    If a stage fails, no further stages are started and the first error is raised once the
+    running ones finish. Each stage is measured by metrics.recorder when one is set up.
+    """
+    waiting = dependencies(stages)
+    done: Set[Stage] = set()
+    running: Dict[Future, Stage] = {}
+    error: Optional[BaseException] = None
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        while True:
+            if error is None:
+                for stage in [stage for stage, deps in waiting.items() if deps <= done]:
+                    del waiting[stage]
+                    running[executor.submit(metrics.measure, stage.converters[0].base_name, stage.name,
+                                            stage.converters, stage.run)] = stage
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                done.add(stage)
+    if error is not None:
+        raise error
+    if waiting:
+        raise ValueError(f"Stages with unsatisfied dependencies: {list(waiting)}")
@@ -0,0 +1,156 @@
+"""Splitting a corpus between machines with --shard, and merging the shards' outputs.
+
+Each topic belongs to shard int(sha256(relative path)) % COUNT, so every node computes the same
+split from the same corpus, however its filesystem orders the files. Each node runs, say,
+
+    python -m automarkup_training_toolkit dita/ --output_dir out-0 --shard 0/4
+
+and records the topics it was given and the ones that failed in out-0/shard.json. Once the
+shard directories are in one place, merge them into one metrics_ready tree or packed dataset:
+
+    python -m automarkup_training_toolkit.sharding out-0 out-1 out-2 out-3 --output_dir merged
+
+The merge stops without writing anything if a shard is missing or given twice, if a topic
+has no output, or if its output appears in more than one shard.
+"""
+import argparse
+from collections import Counter
+import hashlib
+import json
+from pathlib import Path
+import sys
+from typing import Dict, List, Set, Tuple
+
+from automarkup_training_toolkit.dataset import copy_files_metrics_ready, require_zstandard, write_topics
+
+SHARD_MANIFEST = "shard.json"
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse INDEX/COUNT, as in --shard 0/4."""
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, like 0/4, not {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be from 0 to {count - 1}, not {index}")
+    return index, count
+
+
+def shard_of(relative_path: Path, count: int) -> int:
+    """The shard of a topic, from its path relative to the input directory."""
+    digest = hashlib.sha256(Path(relative_path).as_posix().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def select_shard(input_files: List[Path], input_dir: Path, shard: Tuple[int, int]) -> List[Path]:
+    index, count = shard
+    return [input_file for input_file in input_files if shard_of(input_file.relative_to(input_dir), count) == index]
+
+
+def write_shard_manifest(output_dir: Path, shard: Tuple[int, int], input_files: List[Path], input_dir: Path, failed: Set[Path]):
+    manifest = {
+        "shard": list(shard),
+        "topics": sorted(input_file.relative_to(input_dir).as_posix() for input_file in input_files),
+        "failed": sorted(input_file.relative_to(input_dir).as_posix() for input_file in failed),
+    }
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / SHARD_MANIFEST).write_text(json.dumps(manifest, indent=1))
+
+
+def present_topics(formats_dir: Path) -> Set[str]:
+    """The topics in a formats directory that have plain-text output."""
+    return {plain_text_dir.parent.name for plain_text_dir in formats_dir.glob("*/plain_text")
+            if any(plain_text_dir.iterdir())}
+
+
+def check_shards(shard_dirs: List[Path], allow_failed: bool=False) -> Tuple[List[str], Dict[Path, Set[str]]]:
+    """Check that shard_dirs are the complete set of shards and that each topic has output in exactly one of them.
+
+    Returns the problems found and, per shard directory, the topics to leave out of the merge:
+    failed topics, and topics not assigned to the shard, such as leftovers of an earlier split.
+    """
+    problems = []
+    skip: Dict[Path, Set[str]] = {}
+    indexes: Dict[int, Path] = {}
+    counts = set()
+    owners: Dict[str, List[Path]] = {}
+    for shard_dir in shard_dirs:
+        try:
+            manifest = json.loads((shard_dir / SHARD_MANIFEST).read_text())
+        except FileNotFoundError:
+            problems.append(f"{shard_dir}: no {SHARD_MANIFEST}; was it run with --shard?")
+            continue
+        index, count = manifest["shard"]
+        counts.add(count)
+        if index in indexes:
+            problems.append(f"{shard_dir}: shard {index}/{count} is also in {indexes[index]}")
+        indexes[index] = shard_dir
+        names = Counter(Path(topic).stem for topic in manifest["topics"])
+        for topic, uses in sorted(names.items()):
+            if uses > 1:
+                problems.append(f"{shard_dir}: {uses} topics share the output directory {topic}")
+        assigned = set(names)
+        failed = {Path(topic).stem for topic in manifest["failed"]}
+        present = present_topics(shard_dir / "formats")
+        for topic in sorted(failed):
+            if not allow_failed:
+                problems.append(f"{shard_dir}: topic {topic} failed")
+        for topic in sorted(assigned - failed - present):
+            problems.append(f"{shard_dir}: topic {topic} has no output")
+        unexpected = present - assigned
+        if unexpected:
+            print(f"{shard_dir}: leaving out {len(unexpected)} topic(s) not assigned to shard {index}/{count}")
+        skip[shard_dir] = (present & failed) | unexpected
+        for topic in present & assigned - failed:
+            owners.setdefault(topic, []).append(shard_dir)
+    if len(counts) > 1:
+        problems.append(f"shards of different splits: {sorted(counts)} shards")
+    elif counts:
+        count = counts.pop()
+        for index in range(count):
+            if index not in indexes:
+                problems.append(f"shard {index}/{count} is missing")
+    for topic, dirs in sorted(owners.items()):
+        if len(dirs) > 1:
+            problems.append(f"topic {topic} is in more than one shard: {', '.join(map(str, dirs))}")
+    return problems, skip
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the outputs of --shard runs into one metrics_ready tree or dataset.")
+    parser.add_argument("shard_dirs", type=Path, nargs="+", help="Output directories of the shard runs")
+    parser.add_argument("--output_dir", type=Path, default="out", help="Directory for the merged metrics_ready tree or dataset")
+    parser.add_argument("--output_format", choices=("files", "dataset"), default="files", help="Write a metrics_ready directory tree or a packed, sharded dataset")
+    parser.add_argument("--shard_mb", type=int, default=256, help="Maximum size of a dataset shard in megabytes")
+    parser.add_argument("--compress", action="store_true", help="Compress dataset records with zstd")
+    parser.add_argument("--allow_failed", action="store_true", help="Merge without the topics that failed in their shard")
+    args = parser.parse_args()
+    if args.output_format == "dataset" and args.compress:
+        require_zstandard()
+
+    problems, skip = check_shards(args.shard_dirs, args.allow_failed)
+    if problems:
+        print(f"Not merging, {len(problems)} problem(s):")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    if args.output_format == "dataset":
+        dataset_dir = args.output_dir / "dataset"
+        topic_dirs = [shard_dir / "formats" / topic for shard_dir in args.shard_dirs
+                      for topic in present_topics(shard_dir / "formats") - skip[shard_dir]]
+        count = write_topics(sorted(topic_dirs, key=lambda topic_dir: topic_dir.name), dataset_dir,
+                             args.shard_mb * 1024 * 1024, args.compress)
+        print(f"Wrote {count} records from {len(args.shard_dirs)} shards to {dataset_dir}")
+    else:
+        metrics_ready_dir = args.output_dir / "metrics_ready"
+        metrics_ready_dir.mkdir(parents=True, exist_ok=True)
+        for shard_dir in args.shard_dirs:
+            copy_files_metrics_ready(shard_dir / "formats", metrics_ready_dir, skip[shard_dir])
+        print(f"Merged {len(args.shard_dirs)} shards into {metrics_ready_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,13 @@
 import difflib
+import hashlib
 import re
+import tempfile
 from typing import Optional, Set
-from bs4 import BeautifulSoup
+import zlib
 from pathlib import Path
 import argparse
 import markdownify
+from automarkup_training_toolkit import parsers
 
 # TODO: what to do about colspan, rowspan, scope: table attributes, 
 
@@ -19,6 +22,37 @@ ELEMENTS_TO_DELETE = ["object", "samp", "nav", "meta", "figure", "colgroup", "co
 ELEMENTS_TO_SKIP = ["area", "link", "br", "map"]
 ELEMENTS_TO_UNWRAP = ["abbr", "article", "div", "main", "map", "nav", "object", "section", "span", "sub", "sup", "u"]
 
+# off: never check; sampled: check a stable subset of files; full: check every file
+VERIFY_MODES = ("off", "sampled", "full")
+NON_SPACE = re.compile(r"\S+")
+# Where Markdown renderings that fail verification are dumped, unless simplify_html is given a directory
+DIAGNOSTICS_DIR = Path(tempfile.gettempdir()) / "simplify_html"
+
+
+def settings() -> dict:
+    """Everything besides the input that determines simplify_html's output."""
+    return {
+        "attrs_to_delete": ATTRS_TO_DELETE,
+        "attrs_to_ignore": ATTRS_TO_IGNORE,
+        "attrs_to_keep": sorted(ATTRS_TO_KEEP),
+        "elements_to_delete": ELEMENTS_TO_DELETE,
+        "elements_to_skip": ELEMENTS_TO_SKIP,
+        "elements_to_unwrap": ELEMENTS_TO_UNWRAP,
+        "html_parser": parsers.html_parser,
+    }
+
+
+def delete_markdown_irrelevant(element) -> None:
+    """Remove elements and attrs that are part of Markdown but are not
+    practical in Messy Markdown for auto-markup engines"""
+    if element.name in ELEMENTS_TO_DELETE:
+        element.decompose()
+    else:
+        for attr in tuple(element.attrs or ()):
+            if attr in ATTRS_TO_DELETE:
+                del element[attr]
+
+
 def process_element(element, unknown_attrs, all_elements) -> None:
     if not element.name: # already deleted
         return
@@ -47,23 +81,51 @@ def process_element(element, unknown_attrs, all_elements) -> None:
         all_elements.add(element.name)
 
 
+def should_verify(file_path: Path, verify: str, sample_rate: float) -> bool:
+    if verify not in VERIFY_MODES:
+        raise ValueError(f"verify must be one of {VERIFY_MODES}, not {verify!r}")
+    if verify == "sampled":
+        # crc32 rather than hash() so the same files are sampled in every process
+        return zlib.crc32(str(file_path).encode()) % 10000 < sample_rate * 10000
+    return verify == "full"
+
+
+def markdown_digest(markdown: str) -> bytes:
+    """Hash the non-whitespace content of markdown without building a stripped copy."""
+    digest = hashlib.blake2b()
+    for match in NON_SPACE.finditer(markdown):
+        digest.update(match.group().encode())
+    return digest.digest()
+
+
 def simplify_html(
     file_path: Path,
     out_path: Path,
     unknown_attrs: Optional[Set] = None,
     all_elements: Optional[Set] = None,
+    verify: str = "full",
+    sample_rate: float = 0.1,
+    diagnostics_dir: Optional[Path] = None,
 ) -> None:
-    soup = BeautifulSoup(Path(file_path).read_text(), "html.parser")
+    """Write a simplified copy of an HTML file.
+
+    With verification, the file is cleaned in two passes so that Markdown rendered between them
+    can be compared with Markdown rendered at the end, ignoring whitespace. Without it, both
+    cleanups happen in a single walk over the document. On a mismatch both renderings are written
+    to diagnostics_dir as NAME.orig.md and NAME.new.md; they are removed once the file passes.
+    """
+    soup = parsers.make_soup(Path(file_path).read_text())
+
+    if not should_verify(file_path, verify, sample_rate):
+        for element in soup.find_all():
+            if element.name:
+                delete_markdown_irrelevant(element)
+                process_element(element, unknown_attrs, all_elements)
+        out_path.write_text(str(soup))
+        return
 
-    # Remove elements and attrs that are part of Markdown but are not
-    # practical in Messy Markdown for auto-markup engines
     for element in soup():
-        if element.name in ELEMENTS_TO_DELETE:
-            element.decompose()
-        else:
-            for attr in tuple(element.attrs or ()):
-                if attr in ATTRS_TO_DELETE:
-                    del element[attr]
+        delete_markdown_irrelevant(element)
 
     orig = markdownify.MarkdownConverter().convert_soup(soup)
 
@@ -75,18 +137,26 @@ def simplify_html(
 
     new = markdownify.MarkdownConverter().convert_soup(soup)
 
-    if re.sub(r"\s", "", orig) != re.sub(r"\s", "", new):
+    diagnostics_dir = Path(diagnostics_dir or DIAGNOSTICS_DIR)
+    dumps = [diagnostics_dir / Path(out_path).with_suffix(suffix).name for suffix in (".orig.md", ".new.md")]
+    if markdown_digest(orig) != markdown_digest(new):
         diff = difflib.context_diff(orig.splitlines(), new.splitlines())
         diff = "\n".join(diff)
-        Path("/tmp/orig.md").write_text(orig)
-        Path("/tmp/new.md").write_text(new)
+        diagnostics_dir.mkdir(parents=True, exist_ok=True)
+        dumps[0].write_text(orig)
+        dumps[1].write_text(new)
         assert (
             orig == new
         ), f"File {file_path} has changed after simplification. Please check the output: {out_path} : {diff}"
+    for dump in dumps:
+        try:
+            dump.unlink()
+        except FileNotFoundError:
+            pass
 
 
 def process_html_files(
-    directory: Path, out_dir: Path = None, unknown_attrs: Set = None, all_elements: Set = None
+    directory: Path, out_dir: Path = None, unknown_attrs: Set = None, all_elements: Set = None, verify: str = "full"
 ) -> None:
     for file_path in directory.rglob("*.html"):
         if not str(file_path).endswith(".simplified.html"):
@@ -94,7 +164,7 @@ def process_html_files(
                 out_path = out_dir / file_path.name
             else:
                 out_path = Path(file_path).with_suffix(".simplified.html")
-            simplify_html(file_path, out_path, unknown_attrs, all_elements)
+            simplify_html(file_path, out_path, unknown_attrs, all_elements, verify)
 
 
 def main() -> None:
@@ -109,11 +179,17 @@ def main() -> None:
         default=None,
         help="Directory to output processed files. (Optional)",
     )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_MODES,
+        default="full",
+        help="Check that simplification does not change the Markdown rendering.",
+    )
 
     args = parser.parse_args()
     unknown_attrs = set()
     all_elements = set()
-    process_html_files(args.directory, args.outdir, unknown_attrs, all_elements)
+    process_html_files(args.directory, args.outdir, unknown_attrs, all_elements, args.verify)
     if unknown_attrs:
         print("Unknown attributes", unknown_attrs)
     print("Elements", sorted(all_elements))
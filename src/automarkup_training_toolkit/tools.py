@@ -0,0 +1,165 @@
+"""Runs the external tools (DITA-OT's dita and pandoc) with per-tool concurrency caps and timeouts.
+
+Every call goes through the module's runner. It waits for one of the tool's slots, runs the
+tool from an argument list without a shell, and kills the tool's whole process group when its
+timeout expires, so no JVM that dita started is left running. The slots are multiprocessing
+semaphores. The command line passes them to its pool workers, so a cap holds for the whole
+run: all topic threads in all worker processes.
+
+Because each tool runs in a session of its own, a Ctrl-C in the terminal does not reach it.
+stop_on_signals makes SIGINT and SIGTERM kill the running tools and refuse new ones before the
+signal is handled as usual, so the command line stops promptly instead of waiting out the tools.
+
+The runner counts per tool how long calls waited for a slot and how long they ran, which is
+what to look at when tuning the caps:
+
+    dita: 120 runs, 2 timed out, 3 failed; waited 310.2 s, ran 845.0 s (at most 2 at once)
+"""
+import multiprocessing
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+
+class ToolRunner:
+    """Run external tools, at most limits[tool] at a time and for at most timeouts[tool] seconds each.
+
+    Tools without a limit or a timeout, or with 0, are not capped. Passing another runner's
+    semaphores shares its caps, also with runners in other processes.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]]=None, timeouts: Optional[Dict[str, float]]=None,
+                 semaphores: Optional[Dict[str, Any]]=None):
+        self.limits = limits or {}
+        self.timeouts = timeouts or {}
+        if semaphores is None:
+            semaphores = {tool: multiprocessing.BoundedSemaphore(limit) for tool, limit in self.limits.items() if limit}
+        self.semaphores = semaphores
+        self.stats: Dict[str, Dict[str, float]] = {}
+        # Process group ids of the running tools, and whether stop() was called
+        self.process_groups: Set[int] = set()
+        self.stopped = False
+        # Reentrant, since stop() runs from a signal handler that may interrupt the main thread inside run()
+        self._lock = threading.RLock()
+
+    def _count(self, tool: str, **counts: float):
+        with self._lock:
+            stats = self.stats.setdefault(tool, dict.fromkeys(("runs", "timeouts", "failures", "wait", "run"), 0))
+            for name, count in counts.items():
+                stats[name] += count
+
+    def run(self, args: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """Run args like subprocess.run(args, check=True, **kwargs), within the tool's cap and timeout.
+
+        Raises subprocess.TimeoutExpired after killing the tool if it runs for too long,
+        subprocess.CalledProcessError if it fails, and subprocess.SubprocessError once the runner
+        is stopped.
+        """
+        tool = os.path.basename(args[0])
+        args = [str(arg) for arg in args]
+        if self.stopped:
+            raise subprocess.SubprocessError(f"Not running {tool}, the tools were stopped")
+        semaphore = self.semaphores.get(tool)
+        queued = time.perf_counter()
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            started = time.perf_counter()
+            try:
+                returncode = self._run(args, self.timeouts.get(tool) or None, kwargs)
+            except subprocess.TimeoutExpired:
+                self._count(tool, runs=1, timeouts=1, wait=started - queued, run=time.perf_counter() - started)
+                raise
+            self._count(tool, runs=1, failures=returncode != 0, wait=started - queued, run=time.perf_counter() - started)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args)
+        return subprocess.CompletedProcess(args, returncode)
+
+    def _run(self, args: List[str], timeout: Optional[float], kwargs: dict) -> int:
+        # A session of its own lets a timeout kill the tool together with any JVM it started.
+        with subprocess.Popen(args, start_new_session=True, **kwargs) as process:
+            with self._lock:
+                self.process_groups.add(process.pid)
+                if self.stopped:
+                    kill_process_group(process.pid)
+            try:
+                return process.wait(timeout)
+            except BaseException:
+                kill_process_group(process.pid)
+                process.wait()
+                raise
+            finally:
+                with self._lock:
+                    self.process_groups.discard(process.pid)
+
+    def stop(self):
+        """Kill the running tools with everything they started, and refuse to start new ones."""
+        with self._lock:
+            self.stopped = True
+            for process_group in self.process_groups:
+                kill_process_group(process_group)
+
+    def take_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return the per-tool counts and seconds since the last call and reset them."""
+        with self._lock:
+            stats, self.stats = self.stats, {}
+        return {f"tool:{tool}": counts for tool, counts in stats.items()}
+
+
+def kill_process_group(process_group: int):
+    try:
+        os.killpg(process_group, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# The runner the converters use; the command line replaces it with one that has caps and timeouts.
+runner = ToolRunner()
+
+# Whether run prints each command line; iter_examples turns it off while it converts a topic.
+echo = True
+
+
+def run(args: List[str], **kwargs) -> subprocess.CompletedProcess:
+    """Print and run an external tool with the shared runner."""
+    if echo:
+        print(" ".join(shlex.quote(str(arg)) for arg in args) + "\n", end="")
+    return runner.run(args, **kwargs)
+
+
+def stop_on_signals():
+    """Stop the tools of the current runner on SIGINT and SIGTERM, then handle the signal as before.
+
+    Signals the process ignores stay ignored. Call from the main thread.
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+        if previous == signal.SIG_IGN:
+            continue
+
+        def handler(signum, frame, previous=previous):
+            runner.stop()
+            if callable(previous):
+                previous(signum, frame)
+            else:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        signal.signal(signum, handler)
+
+
+def print_stats(stats: Dict[str, Dict[str, float]], limits: Dict[str, int]):
+    for group, counts in sorted(stats.items()):
+        if not group.startswith("tool:"):
+            continue
+        tool = group.partition(":")[2]
+        cap = f"at most {limits[tool]} at once" if limits.get(tool) else "uncapped"
+        print(f"{tool}: {counts['runs']:.0f} runs, {counts['timeouts']:.0f} timed out, {counts['failures']:.0f} failed; "
+              f"waited {counts['wait']:.1f} s, ran {counts['run']:.1f} s ({cap})")
@@ -0,0 +1,170 @@
+"""Streaming removal of elements from an XML document.
+
+remove_elements reads the document with expat and writes everything outside the removed
+elements as it goes, so memory use does not grow with the document. Its output is what
+xml.dom.minidom's parse and writexml produce for the same document with the elements removed,
+DOCTYPE included. Like minidom, it sorts attributes by name before Python 3.8 and keeps their
+document order, namespace declarations first, from 3.8 on.
+"""
+import os
+import sys
+from pathlib import Path
+from typing import Iterable, List, Optional
+from xml.parsers import expat
+
+CHUNK_SIZE = 1 << 16
+# minidom's writexml sorts attributes by name before Python 3.8
+SORTED_ATTRIBUTES = sys.version_info < (3, 8)
+
+
+def escape(data: str) -> str:
+    """Escape character data and attribute values the way minidom does."""
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class ElementRemover:
+    """expat handlers that copy a document, leaving out the named elements and their content."""
+
+    def __init__(self, elements: Iterable[str]):
+        self.elements = frozenset(elements)
+        # Depth inside a removed element; 0 outside of one.
+        self.skipping = 0
+        # An element's start tag is closed with ">" once it has content, or with "/>" at its end.
+        self.open_tag = False
+        self.in_cdata = False
+        self.cdata_started = False
+        self.doctype = ""
+        self.subset: Optional[List[str]] = None
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.ordered_attributes = True
+        self.parser.specified_attributes = True
+        self.parser.StartDoctypeDeclHandler = self.start_doctype
+        self.parser.EndDoctypeDeclHandler = self.end_doctype
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.parser.CharacterDataHandler = self.characters
+        self.parser.StartCdataSectionHandler = self.start_cdata
+        self.parser.EndCdataSectionHandler = self.end_cdata
+        self.parser.CommentHandler = self.comment
+        self.parser.ProcessingInstructionHandler = self.processing_instruction
+
+    def parse(self, f, out):
+        """Filter the bytes read from f to the text file out, one chunk at a time."""
+        pieces = []
+        self.write = pieces.append
+        self.write('<?xml version="1.0" ?>')
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.parser.Parse(chunk, False)
+            out.write("".join(pieces))
+            pieces.clear()
+        self.parser.Parse(b"", True)
+        out.write("".join(pieces))
+
+    def _content(self):
+        """Close the pending start tag; returns False while inside a removed element."""
+        if self.skipping:
+            return False
+        if self.open_tag:
+            self.write(">")
+            self.open_tag = False
+        return True
+
+    def start_doctype(self, name: str, system_id: Optional[str], public_id: Optional[str], has_internal_subset: bool):
+        self.doctype = f"<!DOCTYPE {name}"
+        if public_id:
+            self.doctype += f"  PUBLIC '{public_id}'  '{system_id}'"
+        elif system_id:
+            self.doctype += f"  SYSTEM '{system_id}'"
+        if has_internal_subset:
+            # Like minidom, keep the internal subset verbatim and ignore comments and PIs inside it.
+            self.subset = []
+            self.parser.DefaultHandlerExpand = self.subset.append
+            self.parser.CommentHandler = None
+            self.parser.ProcessingInstructionHandler = None
+
+    def end_doctype(self):
+        if self.subset is not None:
+            subset = "".join(self.subset).replace("\r\n", "\n").replace("\r", "\n")
+            self.doctype += f" [{subset}]"
+            self.subset = None
+            self.parser.DefaultHandlerExpand = None
+            self.parser.CommentHandler = self.comment
+            self.parser.ProcessingInstructionHandler = self.processing_instruction
+        self.write(self.doctype + ">")
+
+    def start_element(self, name: str, attributes: List[str]):
+        if self.skipping or name in self.elements:
+            self.skipping += 1
+            return
+        self._content()
+        pairs = list(zip(attributes[::2], attributes[1::2]))
+        if SORTED_ATTRIBUTES:
+            pairs.sort()
+        else:
+            # minidom lists namespace declarations before the other attributes
+            declarations = [pair for pair in pairs if pair[0] == "xmlns" or pair[0].startswith("xmlns:")]
+            if declarations:
+                pairs = declarations + [pair for pair in pairs if pair not in declarations]
+        self.write("<" + name + "".join(f' {key}="{escape(value)}"' for key, value in pairs))
+        self.open_tag = True
+
+    def end_element(self, name: str):
+        if self.skipping:
+            self.skipping -= 1
+        elif self.open_tag:
+            self.write("/>")
+            self.open_tag = False
+        else:
+            self.write(f"</{name}>")
+
+    def characters(self, data: str):
+        if not self._content():
+            return
+        if self.in_cdata:
+            if not self.cdata_started:
+                self.write("<![CDATA[")
+                self.cdata_started = True
+            self.write(data)
+        else:
+            self.write(escape(data))
+
+    def start_cdata(self):
+        self.in_cdata = True
+        self.cdata_started = False
+
+    def end_cdata(self):
+        if self.cdata_started:
+            self.write("]]>")
+        self.in_cdata = False
+        self.cdata_started = False
+
+    def comment(self, data: str):
+        if self._content():
+            self.write(f"<!--{data}-->")
+
+    def processing_instruction(self, target: str, data: str):
+        if self._content():
+            self.write(f"<?{target} {data}?>")
+
+
+def remove_elements(input_file: Path, output_file: Path, elements: Iterable[str]):
+    """Copy input_file to output_file without the elements named in elements, in a single streaming pass.
+
+    output_file may be input_file; it is replaced atomically once the copy is complete.
+    """
+    output_file = Path(output_file)
+    tmp = output_file.with_name(f".{output_file.name}.tmp")
+    try:
+        with open(input_file, "rb") as f, open(tmp, "w", encoding="utf-8") as out:
+            ElementRemover(elements).parse(f, out)
+        os.replace(tmp, output_file)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except FileNotFoundError:
+            pass
+        raise
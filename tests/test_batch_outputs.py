@@ -0,0 +1,137 @@
+import os
+from pathlib import Path
+import sys
+
+import pytest
+
+from automarkup_training_toolkit.cache import ArtifactCache
+from automarkup_training_toolkit.converters import Converter, PandocRstConverter, SimplifiedDitaConverter
+from automarkup_training_toolkit.manifest import BuildManifest
+
+# Stand-ins for DITA-OT and pandoc that copy their input; batch runs fail while FAIL_BATCH is set.
+FAKE_DITA = """\
+import os, re, shutil, sys
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:])
+source, output = Path(args["input"]), Path(args["output"])
+if source.suffix == ".ditamap":
+    if os.environ.get("FAIL_BATCH"):
+        sys.exit(1)
+    # Like DITA-OT, lay topics out relative to the common directory of the map and the topics.
+    topics = [Path(unquote(urlparse(href).path)) for href in re.findall(r'href="([^"]+)"', source.read_text())]
+    base = Path(os.path.commonpath([source.parent, *(topic.parent for topic in topics)]))
+    for topic in topics:
+        (output / topic.relative_to(base)).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(topic, output / topic.relative_to(base))
+else:
+    output.mkdir(parents=True, exist_ok=True)
+    shutil.copy(source, output / source.name)
+"""
+
+FAKE_PANDOC = """\
+import os, sys
+from pathlib import Path
+args = sys.argv[1:]
+if any(arg.startswith("--lua-filter") for arg in args):
+    if os.environ.get("FAIL_BATCH"):
+        sys.exit(1)
+    manifest = next(arg for arg in args if arg.startswith("--metadata=manifest:")).partition(":")[2]
+    for line in Path(manifest).read_text().splitlines():
+        source, *pairs = line.split("\\t")
+        for format, output in zip(pairs[::2], pairs[1::2]):
+            Path(output).write_text(format + ":" + Path(source).read_text())
+else:
+    source, output, format = args[0], args[args.index("-o") + 1], args[args.index("-t") + 1]
+    Path(output).write_text(format + ":" + Path(source).read_text())
+"""
+
+
+@pytest.fixture
+def tools_on_path(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, source in (("dita", FAKE_DITA), ("pandoc", FAKE_PANDOC)):
+        script = bin_dir / name
+        script.write_text(f"#!{sys.executable}\n{source}")
+        script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(Converter, "cache", ArtifactCache(tmp_path / "cache", 1 << 30))
+
+
+def dita_converters(tmp_path: Path):
+    converters = []
+    for name in ("a", "b"):
+        topic_dir = tmp_path / "out" / name
+        converter = SimplifiedDitaConverter(topic_dir / "markup", name, {"Original": tmp_path / "in" / f"{name}.dita"})
+        converter.manifest = BuildManifest(topic_dir / "build_manifest.json")
+        converters.append(converter)
+    return converters
+
+
+def pandoc_converter(tmp_path: Path):
+    converter = PandocRstConverter(tmp_path / "out", "a", {"Html": tmp_path / "a.html"}, "Html")
+    converter.manifest = BuildManifest(tmp_path / "out" / "build_manifest.json")
+    return converter
+
+
+def assert_not_recorded(converter: Converter, tmp_path: Path):
+    assert converter.outcome != "converted"
+    assert converter.manifest.get(converter.output_file) != converter.fingerprint()
+    assert not converter.cache.get(converter.fingerprint(), tmp_path / "restored")
+
+
+def test_failed_dita_batch_does_not_record_previous_output(tools_on_path, tmp_path, monkeypatch):
+    (tmp_path / "in").mkdir()
+    for name in ("a", "b"):
+        (tmp_path / "in" / f"{name}.dita").write_text(f'<topic id="{name}"><title>old</title></topic>')
+    built = dita_converters(tmp_path)
+    SimplifiedDitaConverter.convert_batch(built)
+    for converter in built:
+        converter.manifest.save()
+    assert "old" in built[0].output_file.read_text()
+
+    (tmp_path / "in" / "a.dita").write_text('<topic id="a"><title>new</title></topic>')
+    monkeypatch.setenv("FAIL_BATCH", "1")
+    rebuilt = dita_converters(tmp_path)
+    SimplifiedDitaConverter.convert_batch(rebuilt)
+    assert_not_recorded(rebuilt[0], tmp_path)
+    assert rebuilt[1].outcome == "skipped"
+
+    rebuilt[0].convert()
+    assert rebuilt[0].outcome == "converted"
+    assert "new" in rebuilt[0].output_file.read_text()
+
+
+def test_failed_pandoc_batch_does_not_record_previous_output(tools_on_path, tmp_path, monkeypatch):
+    html = tmp_path / "a.html"
+    html.write_text("<p>old</p>")
+    built = pandoc_converter(tmp_path)
+    PandocRstConverter.convert_batch([built])
+    built.manifest.save()
+    assert built.output_file.read_text() == "rst:<p>old</p>"
+
+    html.write_text("<p>new</p>")
+    monkeypatch.setenv("FAIL_BATCH", "1")
+    rebuilt = pandoc_converter(tmp_path)
+    # The batch falls back to converting on its own, so stop that fallback to see what the batch recorded.
+    monkeypatch.setattr(PandocRstConverter, "convert", lambda self: None)
+    PandocRstConverter.convert_batch([rebuilt])
+    assert_not_recorded(rebuilt, tmp_path)
+
+
+def test_dita_batch_leaves_the_input_corpus_untouched(tools_on_path, tmp_path):
+    corpus = tmp_path / "in"
+    for name in ("a", "b"):
+        (corpus / name).mkdir(parents=True)
+        (corpus / name / f"{name}.dita").write_text(f'<topic id="{name}"><title>{name}</title></topic>')
+    before = sorted(corpus.rglob("*"))
+    converters = []
+    for name in ("a", "b"):
+        topic = corpus / name / f"{name}.dita"
+        converters.append(SimplifiedDitaConverter(tmp_path / "out" / name, name, {"Original": topic}))
+    SimplifiedDitaConverter.convert_batch(converters)
+    # convert_batch leaves topics without output when the batch did not write them, so these came from the batch.
+    for converter in converters:
+        assert converter.output_file.exists()
+    assert sorted(corpus.rglob("*")) == before
@@ -0,0 +1,50 @@
+import os
+
+from automarkup_training_toolkit.cache import ArtifactCache
+
+
+def test_key_depends_on_content_converter_options_and_version(tmp_path):
+    first, second = tmp_path / "a.html", tmp_path / "b" / "a.html"
+    second.parent.mkdir()
+    first.write_text("<p>same</p>")
+    second.write_text("<p>same</p>")
+    key = ArtifactCache.key(first, "PandocRstConverter", {"format": "rst", "seed": 1}, "1")
+    # Only the bytes count, not the path, and option order does not matter.
+    assert ArtifactCache.key(second, "PandocRstConverter", {"seed": 1, "format": "rst"}, "1") == key
+    assert ArtifactCache.key(first, "PandocRstConverter", {"format": "rst", "seed": 1}, "1") == key
+    assert ArtifactCache.key(first, "PandocTxtConverter", {"format": "rst", "seed": 1}, "1") != key
+    assert ArtifactCache.key(first, "PandocRstConverter", {"format": "rst", "seed": 2}, "1") != key
+    assert ArtifactCache.key(first, "PandocRstConverter", {"format": "rst", "seed": 1}, "2") != key
+    second.write_text("<p>changed</p>")
+    assert ArtifactCache.key(second, "PandocRstConverter", {"format": "rst", "seed": 1}, "1") != key
+
+
+def test_get_restores_what_put_stored(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", 1 << 20)
+    output = tmp_path / "out.rst"
+    output.write_text("text")
+    cache.put("ab" * 32, output)
+    restored = tmp_path / "restored" / "out.rst"
+    assert cache.get("ab" * 32, restored)
+    assert restored.read_text() == "text"
+    assert not cache.get("cd" * 32, tmp_path / "missing.rst")
+    assert cache.take_stats() == {"hits": 1, "misses": 1, "evictions": 0}
+    assert cache.take_stats() == {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def test_evicts_least_recently_used_entries_by_mtime(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", 250)
+    output = tmp_path / "out"
+    output.write_text("x" * 100)
+    keys = [f"{n:02d}" * 32 for n in range(3)]
+    cache.put(keys[0], output)
+    cache.put(keys[1], output)
+    os.utime(cache._path(keys[0]), (1000, 1000))
+    os.utime(cache._path(keys[1]), (2000, 2000))
+    # Reading the older entry makes it the most recently used one.
+    assert cache.get(keys[0], tmp_path / "restored")
+    cache.put(keys[2], output)
+    assert cache.take_stats()["evictions"] == 1
+    assert cache._path(keys[0]).exists()
+    assert not cache._path(keys[1]).exists()
+    assert cache._path(keys[2]).exists()
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from automarkup_training_toolkit.dataset import DatasetReader, ShardWriter, write_dataset
+
+RECORDS = [
+    {"topic": f"topic{n}", "variant": f"{v}.messy", "markup": f"<topic id='t{n}'/>", "html": "<html/>",
+     "text": f"Text {n}.{v} – ünïcode\n" * (n + 1)}
+    for n in range(5) for v in range(1, 3)
+]
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "compressed"])
+def compress(request):
+    if request.param:
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def test_records_round_trip_across_shards(tmp_path, compress):
+    with ShardWriter(tmp_path, max_shard_size=300, compress=compress) as writer:
+        for record in RECORDS:
+            writer.write(record)
+    reader = DatasetReader(tmp_path)
+    assert len(reader.shards()) > 1
+    assert all(shard.name.endswith(".jsonl.zst" if compress else ".jsonl") for shard in reader.shards())
+    assert list(reader) == RECORDS
+    assert len(reader) == len(RECORDS)
+    for record in reversed(RECORDS):
+        assert (record["topic"], record["variant"]) in reader
+        assert reader.get(record["topic"], record["variant"]) == record
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith(".")]
+
+
+def test_rewriting_replaces_the_old_shards(tmp_path, compress):
+    with ShardWriter(tmp_path, max_shard_size=100) as writer:
+        for record in RECORDS:
+            writer.write(record)
+    with ShardWriter(tmp_path, compress=compress) as writer:
+        writer.write(RECORDS[0])
+    reader = DatasetReader(tmp_path)
+    assert len(reader.shards()) == 1
+    assert list(reader) == RECORDS[:1]
+
+
+def test_failed_write_leaves_no_index(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ShardWriter(tmp_path) as writer:
+            writer.write(RECORDS[0])
+            raise RuntimeError
+    assert not (tmp_path / "index.jsonl").exists()
+    assert DatasetReader(tmp_path).shards() == []
+
+
+def test_write_dataset_packs_a_formats_tree(tmp_path, compress, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "prompt.txt").write_text("prompt")
+    for name in ("a", "b", "failed"):
+        topic = tmp_path / "formats" / name
+        (topic / "plain_text").mkdir(parents=True)
+        (topic / "markup").mkdir()
+        (topic / "markup" / f"{name}.dita").write_text(f"<topic id='{name}'/>")
+        (topic / "markup" / f"{name}.html").write_text(f"<p>{name}</p>")
+        for variant in ("1.messy", "rst"):
+            (topic / "plain_text" / f"{name}.{variant}").write_text(f"{name} {variant}")
+    count = write_dataset(tmp_path / "formats", tmp_path / "dataset", {"failed"}, compress=compress)
+    reader = DatasetReader(tmp_path / "dataset")
+    assert count == len(reader) == 4
+    assert reader.get("b", "rst") == {"topic": "b", "variant": "rst", "markup": "<topic id='b'/>",
+                                      "html": "<p>b</p>", "text": "b rst"}
+    assert ("failed", "rst") not in reader
+    assert (tmp_path / "dataset" / "prompt.txt").read_text() == "prompt"
+    index = [json.loads(line) for line in (tmp_path / "dataset" / "index.jsonl").read_text().splitlines()]
+    assert [entry[:2] for entry in index] == [["a", "1.messy"], ["a", "rst"], ["b", "1.messy"], ["b", "rst"]]
+
+
+def test_compression_needs_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr("automarkup_training_toolkit.dataset.zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        ShardWriter(tmp_path, compress=True)
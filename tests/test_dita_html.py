@@ -0,0 +1,103 @@
+"""Tests for dita_html, the experimental in-process renderer behind --native_html.
+
+tests/fixtures/dita holds concept, task and reference topics. Where DITA-OT is on the PATH,
+test_native_html_matches_dita_ot renders each of them both ways and checks that the simplified
+HTML, the messy variant and the MessYE output are the same, which is what the pipeline keeps.
+"""
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from automarkup_training_toolkit import dita_html
+from automarkup_training_toolkit.dita_html import UnsupportedDita, compare_with_dita_ot, render_html
+from automarkup_training_toolkit.simplify_html import simplify_html
+
+FIXTURES = Path(__file__).parent / "fixtures" / "dita"
+TOPICS = sorted(FIXTURES.glob("*.dita"))
+
+# Stand-in for DITA-OT's html5 transtype that writes the native rendering, with DIFFERENT_HTML
+# set a page that differs from it.
+FAKE_DITA = """\
+import os, sys
+from pathlib import Path
+from automarkup_training_toolkit.dita_html import render_html
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[1:])
+source, output = Path(args["input"]), Path(args["output"])
+output.mkdir(parents=True)
+html = render_html(source)
+if os.environ.get("DIFFERENT_HTML"):
+    html = html.replace("</h1>", " (DITA-OT)</h1>")
+(output / source.with_suffix(".html").name).write_text(html)
+"""
+
+
+def dita_ot_available() -> bool:
+    if shutil.which("dita") is None:
+        return False
+    try:
+        version = subprocess.run(["dita", "--version"], capture_output=True, text=True, timeout=60).stdout
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return "DITA-OT" in version
+
+
+@pytest.fixture
+def fake_dita(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "dita"
+    script.write_text(f"#!{sys.executable}\n{FAKE_DITA}")
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+@pytest.mark.skipif(not dita_ot_available(), reason="DITA-OT is not installed")
+@pytest.mark.parametrize("topic", TOPICS, ids=lambda topic: topic.stem)
+def test_native_html_matches_dita_ot(topic, tmp_path):
+    assert compare_with_dita_ot(topic, tmp_path) == []
+
+
+@pytest.mark.parametrize("topic", TOPICS, ids=lambda topic: topic.stem)
+def test_native_html_passes_simplify_verification(topic, tmp_path):
+    html = tmp_path / "topic.raw.html"
+    html.write_text(render_html(topic))
+    simplify_html(html, tmp_path / "topic.html", verify="full", diagnostics_dir=tmp_path / "diagnostics")
+    assert not (tmp_path / "diagnostics").exists()
+
+
+def test_comparison_reports_differing_stages(fake_dita, tmp_path, monkeypatch):
+    assert compare_with_dita_ot(FIXTURES / "concept.dita", tmp_path / "same") == []
+    monkeypatch.setenv("DIFFERENT_HTML", "1")
+    assert compare_with_dita_ot(FIXTURES / "concept.dita", tmp_path / "different") == dita_html.STAGES
+
+
+def test_command_line_compares_a_corpus(fake_dita, tmp_path, monkeypatch):
+    corpus = tmp_path / "corpus"
+    shutil.copytree(FIXTURES, corpus)
+    (corpus / "fn.dita").write_text('<topic id="t"><title>T</title><body><p>a<fn>b</fn></p></body></topic>')
+    monkeypatch.setenv("DIFFERENT_HTML", "1")
+    command = [sys.executable, "-m", "automarkup_training_toolkit.dita_html", "--compare", str(corpus)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert f"{len(TOPICS)} topic(s) compared, 1 left to DITA-OT" in result.stdout
+    assert f"{len(TOPICS)} topic(s) differ" in result.stdout
+
+
+@pytest.mark.parametrize(
+    ("body", "reason"),
+    [
+        ("<p>Text<fn>note</fn></p>", "unsupported element <fn>"),
+        ('<p conref="other.dita#t/p"/>', "unresolved conref"),
+        ("<p><xref href='other.dita'/></p>", "xref without link text"),
+        ("<p><unknown/></p>", "unsupported element <unknown>"),
+    ],
+)
+def test_unsupported_topics_are_left_to_dita_ot(tmp_path, body, reason):
+    topic = tmp_path / "topic.dita"
+    topic.write_text(f'<topic id="t"><title>T</title><body>{body}</body></topic>')
+    with pytest.raises(UnsupportedDita, match=reason):
+        render_html(topic)
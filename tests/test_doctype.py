@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from automarkup_training_toolkit.doctype import DoctypeIndex, sniff_doctype
+
+DOCTYPE = '<!DOCTYPE concept PUBLIC "-//OASIS//DTD DITA Concept//EN" "concept.dtd">\n'
+ROOT = '<concept id="c"><title>T</title></concept>\n'
+
+PROLOGS = {
+    "plain": DOCTYPE,
+    "declaration": '<?xml version="1.0" encoding="UTF-8"?>\n' + DOCTYPE,
+    "comment": '<?xml version="1.0"?>\n<!-- <!DOCTYPE task> <b> -->\n' + DOCTYPE,
+    "processing instruction": '<?xml version="1.0"?><?xml-model href="<x>"?>\n' + DOCTYPE,
+    "internal subset": '<!DOCTYPE concept [\n<!ENTITY e "x">\n]>\n',
+}
+
+
+@pytest.mark.parametrize("prolog", PROLOGS.values(), ids=PROLOGS.keys())
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 9, 4096])
+def test_finds_the_doctype_after_the_prolog(tmp_path, prolog, chunk_size):
+    # Small chunks split every construct, the DOCTYPE name included, across reads.
+    path = tmp_path / "topic.dita"
+    path.write_text(prolog + ROOT)
+    assert sniff_doctype(path, chunk_size) == "concept"
+
+
+def test_skips_a_byte_order_mark(tmp_path):
+    path = tmp_path / "topic.dita"
+    path.write_bytes(b"\xef\xbb\xbf" + ('<?xml version="1.0"?>\n' + DOCTYPE + ROOT).encode())
+    assert sniff_doctype(path, 2) == "concept"
+
+
+@pytest.mark.parametrize("text", [ROOT, ROOT + DOCTYPE, "", "<!-- unterminated", "no markup"],
+                         ids=["no doctype", "doctype after root", "empty", "open comment", "text"])
+def test_returns_none_without_a_doctype_before_the_root(tmp_path, text):
+    path = tmp_path / "topic.dita"
+    path.write_text(text)
+    assert sniff_doctype(path, 3) is None
+
+
+def test_index_reuses_entries_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "topic.dita"
+    path.write_text(DOCTYPE + ROOT)
+    index = DoctypeIndex(tmp_path / "index.json")
+    assert index.matches(path, "con")
+    assert not index.matches(path, "task")
+    index.save()
+
+    reloaded = DoctypeIndex(tmp_path / "index.json")
+    monkeypatch.setattr("automarkup_training_toolkit.doctype.sniff_doctype", lambda path: pytest.fail("re-read"))
+    assert reloaded.doctype(path) == "concept"
+    monkeypatch.undo()
+
+    stat = path.stat()
+    path.write_text(DOCTYPE.replace("concept", "task ") + ROOT)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert reloaded.doctype(path) == "task"
@@ -0,0 +1,47 @@
+import shutil
+import sys
+
+from automarkup_training_toolkit.dataset import copy_files_metrics_ready
+from automarkup_training_toolkit.fileutils import clone_or_copy
+
+
+def test_copy_keeps_its_contents_when_the_source_is_rewritten_in_place(tmp_path):
+    source, target = tmp_path / "a.messy", tmp_path / "b.txt"
+    source.write_text("first")
+    clone_or_copy(source, target)
+    # What Path.write_text and the cache's shutil.copyfile restore do to an existing output
+    source.write_text("second, longer")
+    assert target.read_text() == "first"
+    with open(source, "w"):
+        pass
+    assert target.read_text() == "first"
+    assert [path.name for path in tmp_path.iterdir() if path.name.startswith(".")] == []
+
+
+def test_copies_without_fcntl(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    source, target = tmp_path / "a", tmp_path / "b"
+    source.write_text("text")
+    clone_or_copy(source, target)
+    assert target.read_text() == "text"
+
+
+def test_rebuilt_formats_do_not_change_metrics_ready(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "prompt.txt").write_text("prompt")
+    topic = tmp_path / "formats" / "topic1"
+    (topic / "plain_text").mkdir(parents=True)
+    (topic / "markup").mkdir()
+    (topic / "plain_text" / "topic1.1.messy").write_text("old text")
+    (topic / "markup" / "topic1.dita").write_text("<topic/>")
+    (topic / "markup" / "topic1.html").write_text("<html/>")
+    copy_files_metrics_ready(tmp_path / "formats", tmp_path / "metrics_ready")
+    published = tmp_path / "metrics_ready" / "topic1" / "topic1.1.messy.txt"
+    assert published.read_text() == "old text"
+
+    shutil.copyfile(tmp_path / "prompt.txt", topic / "plain_text" / "topic1.1.messy")
+    assert published.read_text() == "old text"
+    copy_files_metrics_ready(tmp_path / "formats", tmp_path / "metrics_ready")
+    assert published.read_text() == "prompt"
+    assert (published.parent / "prompt.txt").read_text() == "prompt"
+    assert published.with_suffix(".xml").read_text() == "<topic/>"
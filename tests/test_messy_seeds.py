@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+from automarkup_training_toolkit.converters import HtmlToMessyConverter
+from automarkup_training_toolkit.pipeline import build_converters
+
+FIXTURE = Path(__file__).parent / "fixtures" / "html" / "concept.html"
+
+# Writes html_to_messy's default variant and five converter variants, two of them through the batch path.
+CONVERT = """\
+import sys
+from pathlib import Path
+from automarkup_training_toolkit.converters import HtmlToMessyConverter
+from automarkup_training_toolkit.html_to_messy import html_to_messy
+source, output_dir, topic_path = Path(sys.argv[1]), Path(sys.argv[2]), sys.argv[3]
+output_dir.mkdir()
+html_to_messy(source, output_dir / "default.messy")
+transformations = {"Html": source}
+converters = [HtmlToMessyConverter(output_dir, "concept", transformations, "Html", seed, topic_path) for seed in range(1, 6)]
+for converter in converters[:3]:
+    converter.convert()
+HtmlToMessyConverter.convert_batch(converters[3:])
+"""
+
+
+def convert(source: Path, output_dir: Path, hash_seed: str, topic_path: str="concept.dita") -> dict:
+    env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+    subprocess.run([sys.executable, "-c", CONVERT, str(source), str(output_dir), topic_path], env=env, check=True)
+    return {path.name: path.read_bytes() for path in sorted(output_dir.iterdir())}
+
+
+def test_outputs_are_identical_across_interpreters(tmp_path):
+    # The second interpreter also reads the topic from another directory: seeds depend on the topic's
+    # path relative to the input directory only.
+    elsewhere = tmp_path / "elsewhere" / "concept.html"
+    elsewhere.parent.mkdir()
+    shutil.copy(FIXTURE, elsewhere)
+    first = convert(FIXTURE, tmp_path / "first", "1")
+    second = convert(elsewhere, tmp_path / "second", "2")
+    assert len(first) == 6
+    assert first == second
+    assert len(set(first.values())) > 1
+
+
+def test_topics_of_the_same_name_get_different_variants(tmp_path):
+    first = convert(FIXTURE, tmp_path / "a", "1", "a/concept.dita")
+    second = convert(FIXTURE, tmp_path / "b", "1", "b/concept.dita")
+    assert first["default.messy"] == second["default.messy"]
+    del first["default.messy"], second["default.messy"]
+    assert all(first[name] != second[name] for name in first)
+
+
+def test_converters_are_seeded_from_the_relative_path(tmp_path):
+    input_dir = tmp_path / "corpus"
+    converters = [converter for topic in ("a/intro.dita", "b/intro.dita")
+                  for converter in build_converters(input_dir / topic, input_dir, tmp_path / "out", 1)
+                  if type(converter) is HtmlToMessyConverter]
+    assert [converter.topic_path for converter in converters] == ["a/intro.dita", "b/intro.dita"]
+    assert converters[0].messy_seed() != converters[1].messy_seed()
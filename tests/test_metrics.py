@@ -0,0 +1,77 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from automarkup_training_toolkit import metrics
+
+
+def converter(tmp_path, name: str, outcome: str, size: int):
+    output = tmp_path / f"{name}.out"
+    output.write_bytes(b"x" * size)
+    return SimpleNamespace(input_file=tmp_path / "in.html", output_file=output, outcome=outcome)
+
+
+def fail():
+    raise RuntimeError("failed")
+
+
+@pytest.fixture
+def records(tmp_path):
+    (tmp_path / "in.html").write_bytes(b"y" * 10)
+    recorder = metrics.StageRecorder()
+    converters = [converter(tmp_path, "rst", "converted", 100), converter(tmp_path, "org", "cached", 50)]
+    recorder.measure("topic1", "PandocConverter", converters, lambda: sum(range(10000)))
+    with pytest.raises(RuntimeError):
+        recorder.measure("topic1", "HtmlToMessyConverter", [converter(tmp_path, "messy", None, 7)],
+                         fail)
+    taken = recorder.take()
+    assert recorder.take() == []
+    return taken
+
+
+def test_records_successful_and_failed_stages(records):
+    pandoc, messy = records
+    assert pandoc["topic"] == "topic1" and pandoc["stage"] == "PandocConverter"
+    assert pandoc["ok"] and not messy["ok"]
+    # The shared input is counted once.
+    assert (pandoc["bytes_in"], pandoc["bytes_out"]) == (10, 150)
+    assert (pandoc["converted"], pandoc["cached"], pandoc["skipped"]) == (1, 1, 0)
+    assert pandoc["wall"] >= pandoc["cpu"] >= 0
+    assert pandoc["pid"] == os.getpid()
+
+
+def test_writes_json_lines_and_a_chrome_trace(records, tmp_path):
+    metrics.write_jsonl(tmp_path / "stages.jsonl", records)
+    lines = (tmp_path / "stages.jsonl").read_text().splitlines()
+    assert [json.loads(line) for line in lines] == records
+
+    metrics.write_trace(tmp_path / "trace.json", records)
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    events = trace["traceEvents"]
+    assert [event["name"] for event in events] == ["PandocConverter", "HtmlToMessyConverter"]
+    assert all(event["ph"] == "X" and event["cat"] == "stage" for event in events)
+    assert events[0]["ts"] == int(records[0]["start"] * 1e6)
+    assert events[0]["dur"] == int(records[0]["wall"] * 1e6)
+    assert events[0]["tid"] == records[0]["thread"]
+    assert events[0]["args"]["bytes_out"] == 150
+    assert events[1]["args"]["ok"] is False
+
+
+def test_summary_totals_stages(records, capsys):
+    totals = metrics.summarize(records + records[:1])
+    assert totals["PandocConverter"]["runs"] == 2
+    assert totals["PandocConverter"]["converted"] == 2
+    assert totals["PandocConverter"]["bytes_out"] == 300
+    assert totals["HtmlToMessyConverter"]["failed"] == 1
+    metrics.print_summary(records)
+    assert "PandocConverter" in capsys.readouterr().out
+
+
+def test_measure_without_a_recorder_only_runs(monkeypatch):
+    monkeypatch.setattr(metrics, "recorder", None)
+    ran = []
+    metrics.measure("topic1", "stage", [], lambda: ran.append(True))
+    assert ran == [True]
+    assert metrics.take_records() == []
@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("module", ["simplify_html", "html_to_messy", "dita_html", "parsers"])
+def test_module_entry_points_run_once(module):
+    # Importing the package must not import the module that runpy is about to run as __main__.
+    result = subprocess.run(
+        [sys.executable, "-W", "error::RuntimeWarning", "-m", f"automarkup_training_toolkit.{module}", "--help"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_iter_examples_is_loaded_on_first_use():
+    code = (
+        "import sys, automarkup_training_toolkit as toolkit\n"
+        "assert 'automarkup_training_toolkit.pipeline' not in sys.modules\n"
+        "assert toolkit.iter_examples.__module__ == 'automarkup_training_toolkit.pipeline'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,45 @@
+import shutil
+
+import pytest
+
+from automarkup_training_toolkit.converters import (
+    PandocAsciidocConverter,
+    PandocOrgModeConverter,
+    PandocRstConverter,
+    PandocTxtConverter,
+)
+
+pytestmark = pytest.mark.skipif(shutil.which("pandoc") is None, reason="pandoc is not installed")
+
+FORMATS = (PandocRstConverter, PandocTxtConverter, PandocAsciidocConverter, PandocOrgModeConverter)
+
+HTML = """<!DOCTYPE html>
+<html><head><title>Topic</title></head><body>
+<h1>Topic</h1>
+<p>First <b>bold</b> paragraph with a <a href="http://example.org">link</a>.</p>
+<ul><li>one</li><li>two <code>x = 1</code></li></ul>
+<table><tr><th>a</th><th>b</th></tr><tr><td>1</td><td>2</td></tr></table>
+<pre>print("hi")</pre>
+</body></html>
+"""
+
+# Writers return no text at all for an empty body; the command line still writes a newline.
+EMPTY_HTML = "<html><head><title>Empty</title></head><body></body></html>"
+
+
+def converters_for(tmp_path, name, text):
+    html = tmp_path / "topic.html"
+    html.write_text(text)
+    transformations = {"Html": html}
+    return [cls(tmp_path / name, "topic", transformations, "Html") for cls in FORMATS]
+
+
+@pytest.mark.parametrize("text", [HTML, EMPTY_HTML], ids=["topic", "empty"])
+def test_batch_matches_one_format_at_a_time(tmp_path, text):
+    batch = converters_for(tmp_path, "batch", text)
+    PandocRstConverter.convert_batch(batch)
+    single = converters_for(tmp_path, "single", text)
+    for converter in single:
+        converter.convert()
+    for batched, alone in zip(batch, single):
+        assert batched.output_file.read_bytes() == alone.output_file.read_bytes(), batched.format
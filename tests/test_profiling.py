@@ -0,0 +1,23 @@
+from argparse import Namespace
+from pathlib import Path
+
+from automarkup_training_toolkit.__main__ import stage_workers
+from automarkup_training_toolkit.profiling import REPORT_NAME, Profiler
+
+
+def test_peak_memory_is_measured_per_document(tmp_path):
+    profiler = Profiler()
+    for size in (1_000_000, 10):
+        with profiler.measure("Converter", f"{size}.html"):
+            data = [0] * size
+            del data
+    peaks = {document: peak for _, peak, _, document in profiler.documents}
+    assert peaks["1000000.html"] > 1_000_000
+    assert peaks["10.html"] < 100_000
+    profiler.write_report(tmp_path)
+    assert "Converter: 2 documents" in (tmp_path / REPORT_NAME).read_text()
+
+
+def test_profiling_runs_stages_one_at_a_time():
+    assert stage_workers(Namespace(profile=None, stage_workers=4)) == 4
+    assert stage_workers(Namespace(profile=Path("profile"), stage_workers=4)) == 1
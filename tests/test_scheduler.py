@@ -0,0 +1,86 @@
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from automarkup_training_toolkit.converters import Converter
+from automarkup_training_toolkit.scheduler import Stage, dependencies, run_stages
+
+
+class Step(Converter):
+    """A converter that only records when it ran, providing `key` from `dependent_key`."""
+
+    def __init__(self, key: str, dependent_key: str, log: list, delay: float=0, error: bool=False):
+        self.key = key
+        super().__init__(Path("out"), "topic", {}, dependent_key)
+        self.log = log
+        self.delay = delay
+        self.error = error
+
+    def convert(self):
+        self.log.append(("start", self.key))
+        time.sleep(self.delay)
+        if self.error:
+            raise RuntimeError(f"{self.key} failed")
+        self.log.append(("end", self.key))
+
+    def get_output_filename(self):
+        return "out.txt"
+
+    def get_key(self):
+        return self.key
+
+
+def stage(*args, **kwargs) -> Stage:
+    return Stage([Step(*args, **kwargs)])
+
+
+def test_dependencies_follow_transformation_keys():
+    dita, html, simple, rst = (stage("dita", "Original", []), stage("html", "dita", []),
+                               stage("simple", "html", []), stage("rst", "simple", []))
+    assert dependencies([dita, html, simple, rst]) == {dita: set(), html: {dita}, simple: {html}, rst: {simple}}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_stages_start_after_their_dependencies(workers):
+    log = []
+    # Listed out of order, with the slow stage first, so only the dependencies keep the order.
+    stages = [stage("messy", "simple", log), stage("simple", "html", log, delay=0.05),
+              stage("rst", "simple", log), stage("html", "Original", log, delay=0.05)]
+    run_stages(stages, workers)
+    ends = {key: log.index(("end", key)) for _, key in log}
+    starts = {key: log.index(("start", key)) for _, key in log}
+    assert ends["html"] < starts["simple"]
+    assert ends["simple"] < starts["messy"]
+    assert ends["simple"] < starts["rst"]
+    assert len(log) == 8
+
+
+def test_independent_stages_overlap():
+    log = []
+    started = threading.Barrier(2, timeout=5)
+    stages = [stage("html", "Original", log)]
+    for key in ("rst", "messy"):
+        stages.append(Stage([Step(key, "html", log)], run=started.wait, name=key))
+    # Both dependants wait for each other, which only finishes when they run at the same time.
+    run_stages(stages, 2)
+
+
+def test_first_error_is_raised_and_stops_later_stages():
+    log = []
+    stages = [stage("html", "Original", log), stage("simple", "html", log, delay=0.05, error=True),
+              stage("rst", "html", log, delay=0.2, error=True), stage("messy", "simple", log)]
+    with pytest.raises(RuntimeError, match="simple failed"):
+        run_stages(stages, 2)
+    # The stage already running finishes, but nothing depending on the failure starts.
+    assert ("start", "rst") in log
+    assert ("start", "messy") not in log
+
+
+def test_unsatisfied_dependencies_are_reported():
+    log = []
+    first, second = stage("a", "b", log), stage("b", "a", log)
+    with pytest.raises(ValueError, match="unsatisfied dependencies"):
+        run_stages([first, second])
+    assert log == []
@@ -0,0 +1,112 @@
+import argparse
+from pathlib import Path
+import sys
+
+import pytest
+
+from automarkup_training_toolkit import sharding
+from automarkup_training_toolkit.sharding import check_shards, parse_shard, select_shard, shard_of, write_shard_manifest
+
+TOPICS = [Path("corpus") / f"dir{n % 3}" / f"topic{n}.dita" for n in range(40)]
+
+
+def test_parse_shard():
+    assert parse_shard("0/4") == (0, 4)
+    assert parse_shard("3/4") == (3, 4)
+    for value in ("4/4", "-1/4", "1", "a/b", "0/0"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(value)
+
+
+def test_every_topic_is_in_exactly_one_shard():
+    input_dir = Path("corpus")
+    shards = [select_shard(TOPICS, input_dir, (index, 4)) for index in range(4)]
+    assert sorted(topic for shard in shards for topic in shard) == sorted(TOPICS)
+    assert all(shards)
+    # The order the filesystem lists the files in does not matter.
+    assert select_shard(list(reversed(TOPICS)), input_dir, (1, 4)) == list(reversed(shards[1]))
+
+
+def test_shard_depends_only_on_the_relative_path():
+    assert shard_of(Path("dir1/topic1.dita"), 4) == shard_of("dir1/topic1.dita", 4)
+    assert [shard_of(f"dir{n % 3}/topic{n}.dita", 4) for n in range(8)] == [3, 0, 1, 1, 2, 0, 2, 0]
+
+
+def make_shard(root: Path, index: int, count: int, topics: list, failed: list=(), present: list=None) -> Path:
+    """A shard's output directory: its manifest, and plain-text output for the present topics."""
+    shard_dir = root / f"out-{index}"
+    input_dir = Path("corpus")
+    write_shard_manifest(shard_dir, (index, count), [input_dir / topic for topic in topics], input_dir,
+                         {input_dir / topic for topic in failed})
+    for topic in (present if present is not None else [topic for topic in topics if topic not in failed]):
+        name = Path(topic).stem
+        (shard_dir / "formats" / name / "plain_text").mkdir(parents=True, exist_ok=True)
+        (shard_dir / "formats" / name / "markup").mkdir(exist_ok=True)
+        (shard_dir / "formats" / name / "plain_text" / f"{name}.1.messy").write_text(f"{name} text")
+        (shard_dir / "formats" / name / "markup" / f"{name}.dita").write_text(f"<topic id='{name}'/>")
+        (shard_dir / "formats" / name / "markup" / f"{name}.html").write_text(f"<p>{name}</p>")
+    return shard_dir
+
+
+def test_complete_shards_merge_cleanly(tmp_path):
+    shards = [make_shard(tmp_path, 0, 2, ["a.dita", "b.dita"]), make_shard(tmp_path, 1, 2, ["sub/c.dita"])]
+    assert check_shards(shards) == ([], {shards[0]: set(), shards[1]: set()})
+
+
+@pytest.mark.parametrize(
+    ("layout", "problem"),
+    [
+        ([(0, 3, ["a.dita"]), (1, 3, ["b.dita"])], "shard 2/3 is missing"),
+        ([(0, 2, ["a.dita"]), (0, 2, ["b.dita"])], "shard 0/2 is also in"),
+        ([(0, 2, ["a.dita"]), (1, 3, ["b.dita"])], "shards of different splits: [2, 3] shards"),
+        ([(0, 1, ["a.dita", "sub/a.dita"])], "2 topics share the output directory a"),
+    ],
+)
+def test_incomplete_or_mixed_shards_are_refused(tmp_path, layout, problem):
+    shards = []
+    for n, (index, count, topics) in enumerate(layout):
+        shards.append(make_shard(tmp_path / str(n), index, count, topics))
+    problems, _ = check_shards(shards)
+    assert any(problem in found for found in problems), problems
+
+
+def test_missing_manifest_and_output_are_refused(tmp_path):
+    no_manifest = tmp_path / "out-x"
+    no_manifest.mkdir()
+    empty = make_shard(tmp_path, 0, 1, ["a.dita"], present=[])
+    problems, _ = check_shards([no_manifest, empty])
+    assert f"{no_manifest}: no shard.json; was it run with --shard?" in problems
+    assert f"{empty}: topic a has no output" in problems
+
+
+def test_topic_in_two_shards_is_refused(tmp_path):
+    # A topic assigned to both shards, as when they were run on diverging copies of the corpus.
+    shards = [make_shard(tmp_path, 0, 2, ["a.dita"]), make_shard(tmp_path, 1, 2, ["a.dita", "b.dita"])]
+    problems, _ = check_shards(shards)
+    assert problems == [f"topic a is in more than one shard: {shards[0]}, {shards[1]}"]
+
+
+def test_failed_and_unassigned_topics_are_left_out(tmp_path):
+    # b failed but left partial output; c is a leftover of an earlier split.
+    shard = make_shard(tmp_path, 0, 1, ["a.dita", "b.dita"], failed=["b.dita"], present=["a.dita", "b.dita", "c.dita"])
+    problems, _ = check_shards([shard])
+    assert problems == [f"{shard}: topic b failed"]
+    assert check_shards([shard], allow_failed=True) == ([], {shard: {"b", "c"}})
+
+
+def test_merge_writes_only_checked_topics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "prompt.txt").write_text("prompt")
+    shards = [make_shard(tmp_path, 0, 2, ["a.dita", "b.dita"], failed=["b.dita"], present=["a.dita", "b.dita"]),
+              make_shard(tmp_path, 1, 2, ["c.dita"])]
+    argv = ["sharding", *map(str, shards), "--output_dir", str(tmp_path / "merged")]
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit):
+        sharding.main()
+    assert not (tmp_path / "merged").exists()
+
+    monkeypatch.setattr(sys, "argv", argv + ["--allow_failed"])
+    sharding.main()
+    merged = tmp_path / "merged" / "metrics_ready"
+    assert sorted(path.name for path in merged.iterdir()) == ["a", "c"]
+    assert (merged / "c" / "c.1.messy.txt").read_text() == "c text"
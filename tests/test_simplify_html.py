@@ -0,0 +1,23 @@
+import pytest
+
+from automarkup_training_toolkit import simplify_html as simplify
+
+HTML = '<html><body><div class="body"><p id="p">See <a href="x.html">x</a>.</p></div></body></html>'
+
+
+def test_verification_dumps_mismatches_outside_the_output_tree(tmp_path, monkeypatch):
+    source, output, diagnostics = tmp_path / "topic.raw.html", tmp_path / "markup" / "topic.html", tmp_path / "diagnostics"
+    source.write_text(HTML)
+    output.parent.mkdir()
+    # Dropping href changes the Markdown rendering, so the verification fails.
+    monkeypatch.setattr(simplify, "ATTRS_TO_IGNORE", simplify.ATTRS_TO_IGNORE + ["href"])
+    with pytest.raises(AssertionError, match="has changed after simplification"):
+        simplify.simplify_html(source, output, verify="full", diagnostics_dir=diagnostics)
+    assert "(x.html)" in (diagnostics / "topic.orig.md").read_text()
+    assert "(x.html)" not in (diagnostics / "topic.new.md").read_text()
+    assert sorted(path.name for path in output.parent.iterdir()) == ["topic.html"]
+
+    monkeypatch.undo()
+    simplify.simplify_html(source, output, verify="full", diagnostics_dir=diagnostics)
+    assert list(diagnostics.iterdir()) == []
+    assert output.read_text() == '<html><body><p>See <a href="x.html">x</a>.</p></body></html>'
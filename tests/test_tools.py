@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from automarkup_training_toolkit.tools import ToolRunner
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="checks processes through /proc")
+
+# A tool that starts a long-running child, like dita starting a JVM, and records the child's pid.
+TOOL = """\
+import subprocess, sys
+child = subprocess.Popen(["sleep", "60"])
+open(sys.argv[1], "w").write(str(child.pid))
+child.wait()
+"""
+
+
+def running(pid: int) -> bool:
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except FileNotFoundError:
+        return False
+    return stat.rpartition(")")[2].split()[0] != "Z"
+
+
+def assert_killed(pid: int, timeout: float = 5):
+    # SIGKILL is delivered asynchronously, so the child may take a moment to go.
+    deadline = time.monotonic() + timeout
+    while running(pid):
+        assert time.monotonic() < deadline, f"process {pid} is still running"
+        time.sleep(0.05)
+
+
+def wait_for(path: Path, timeout: float = 10) -> int:
+    deadline = time.monotonic() + timeout
+    while not (path.exists() and path.read_text()):
+        assert time.monotonic() < deadline, f"{path} was not written"
+        time.sleep(0.05)
+    return int(path.read_text())
+
+
+def test_stop_kills_running_tools_and_refuses_new_ones(tmp_path):
+    runner = ToolRunner()
+    pid_file = tmp_path / "child.pid"
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(runner.run, [sys.executable, "-c", TOOL, str(pid_file)])
+        child = wait_for(pid_file)
+        runner.stop()
+        with pytest.raises(subprocess.CalledProcessError):
+            future.result(timeout=10)
+    assert_killed(child)
+    with pytest.raises(subprocess.SubprocessError):
+        runner.run([sys.executable, "-c", "pass"])
+
+
+def test_timeout_kills_the_tool_with_its_children(tmp_path):
+    runner = ToolRunner(timeouts={os.path.basename(sys.executable): 1})
+    pid_file = tmp_path / "child.pid"
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner.run([sys.executable, "-c", TOOL, str(pid_file)])
+    assert_killed(int(pid_file.read_text()))
+
+
+@pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM], ids=["SIGINT", "SIGTERM"])
+def test_signal_stops_tools_running_in_stage_threads(tmp_path, signum):
+    pid_file = tmp_path / "child.pid"
+    code = (
+        "import sys\n"
+        "from concurrent.futures import ThreadPoolExecutor\n"
+        "from automarkup_training_toolkit import tools\n"
+        "tools.stop_on_signals()\n"
+        "with ThreadPoolExecutor(1) as executor:\n"
+        f"    executor.submit(tools.runner.run, [sys.executable, '-c', {TOOL!r}, {str(pid_file)!r}]).result()\n"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code],
+        stderr=subprocess.PIPE,
+        text=True,
+        preexec_fn=lambda: signal.signal(signal.SIGINT, signal.SIG_DFL),
+    )
+    child = wait_for(pid_file)
+    process.send_signal(signum)
+    _, stderr = process.communicate(timeout=10)
+    assert process.returncode != 0
+    if signum == signal.SIGINT:
+        assert "KeyboardInterrupt" in stderr
+    assert_killed(child)
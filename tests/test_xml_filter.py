@@ -0,0 +1,68 @@
+import sys
+from xml.dom import minidom
+from xml.parsers.expat import ExpatError
+
+import pytest
+
+from automarkup_training_toolkit.xml_filter import remove_elements
+
+DOCUMENT = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE concept PUBLIC "-//OASIS//DTD DITA Concept//EN" "concept.dtd" [
+<!ENTITY product "Widget &amp; Co">
+]>
+<concept id="c" xmlns:ditaarch="http://dita.oasis-open.org/architecture/2005/" class="- topic/topic ">
+  <title>About &product;</title>
+  <prolog><author>someone</author></prolog>
+  <conbody><p>a &lt; b "quoted" <b/></p><!-- note --><?pi data?>
+    <codeblock><![CDATA[x < 1 && y]]></codeblock>
+  </conbody>
+  <related-links><link href="x.dita"/></related-links>
+</concept>
+"""
+
+EXPECTED = """<?xml version="1.0" ?><!DOCTYPE concept  PUBLIC '-//OASIS//DTD DITA Concept//EN'  'concept.dtd' [
+<!ENTITY product "Widget &amp; Co">
+]><concept %s>
+  <title>About Widget &amp; Co</title>
+  
+  <conbody><p>a &lt; b &quot;quoted&quot; <b/></p><!-- note --><?pi data?>
+    <codeblock><![CDATA[x < 1 && y]]></codeblock>
+  </conbody>
+  
+</concept>""" % (
+    'class="- topic/topic " id="c" xmlns:ditaarch="http://dita.oasis-open.org/architecture/2005/"'
+    if sys.version_info < (3, 8)
+    else 'xmlns:ditaarch="http://dita.oasis-open.org/architecture/2005/" id="c" class="- topic/topic "'
+)
+
+
+def minidom_removal(path, elements):
+    document = minidom.parse(str(path))
+    for name in elements:
+        for element in document.getElementsByTagName(name):
+            element.parentNode.removeChild(element)
+    return document.toxml()
+
+
+def test_removes_elements(tmp_path):
+    source = tmp_path / "topic.dita"
+    source.write_text(DOCUMENT)
+    output = tmp_path / "out.dita"
+    remove_elements(source, output, ["prolog", "related-links"])
+    assert output.read_text() == EXPECTED
+
+
+def test_matches_minidom(tmp_path):
+    source = tmp_path / "topic.dita"
+    source.write_text(DOCUMENT)
+    output = tmp_path / "out.dita"
+    remove_elements(source, output, ["prolog", "related-links"])
+    assert output.read_text() == minidom_removal(source, ["prolog", "related-links"])
+
+
+def test_leaves_no_temporary_file_on_error(tmp_path):
+    source = tmp_path / "topic.dita"
+    source.write_text("<concept><title>unclosed</concept>")
+    with pytest.raises(ExpatError):
+        remove_elements(source, source, ["prolog"])
+    assert [path.name for path in tmp_path.iterdir()] == ["topic.dita"]